@@ -13,4 +13,15 @@ celery_app = Celery(
 # The worker lives in a separate service/package, but for local dev we just call by name.
 celery_app.conf.update(
     task_track_started=True,
+    # Bound Redis memory: task results only need to outlive the UI/API reconciling them.
+    # msgpack frames are smaller/faster than JSON; keep accepting JSON while older producers drain.
+    task_serializer="msgpack",
+    result_serializer="msgpack",
+    accept_content=["msgpack", "json"],
+    result_expires=3600,
+    # Keep idle broker/result connections alive through NAT/conntrack timeouts instead of reconnecting on next use.
+    broker_transport_options={"visibility_timeout": 3600, "socket_keepalive": True},
+    redis_socket_keepalive=True,
+    # Must match the worker's prefix, or results are written/read under different keys.
+    result_backend_transport_options={"global_keyprefix": "aia:"},
 )
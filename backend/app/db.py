@@ -1,47 +1,155 @@
 from __future__ import annotations
 
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .settings import settings
 
 engine = create_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {},
+    **(
+        {"connect_args": {"check_same_thread": False}}
+        if settings.database_url.startswith("sqlite")
+        else {"pool_size": 20, "max_overflow": 10, "pool_pre_ping": True}
+    ),
 )
 
 
+def _async_url(url: str) -> str:
+    # Same database, async driver (Postgres deployments need asyncpg installed).
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Request handlers use the async engine so DB I/O doesn't block the event loop or tie up the threadpool.
+# The sync engine above is kept for startup migrations and maintenance.
+async_engine = create_async_engine(
+    settings.async_database_url or _async_url(settings.database_url),
+    **(
+        # aiosqlite defaults to NullPool for file databases (a fresh connection + PRAGMA setup per session);
+        # pool them so the page cache and mmap stay warm across requests.
+        {"poolclass": AsyncAdaptedQueuePool, "pool_size": 10, "max_overflow": 10}
+        if settings.database_url.startswith("sqlite")
+        else {"pool_size": 20, "max_overflow": 10, "pool_pre_ping": True}
+    ),
+)
+
+# Objects stay usable after commit, so handlers don't pay a refresh SELECT just to serialize them.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# WAL lets readers proceed while the worker/uploads write; NORMAL sync is durable enough under WAL.
+_SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "mmap_size=268435456",
+    "cache_size=-40000",
+    "temp_store=MEMORY",
+    "busy_timeout=5000",
+    "foreign_keys=ON",
+)
+
+
+def _set_sqlite_pragmas(dbapi_conn, _connection_record) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        for pragma in _SQLITE_PRAGMAS:
+            cur.execute(f"PRAGMA {pragma}")
+    finally:
+        cur.close()
+
+
+def _optimize_sqlite_on_close(dbapi_conn, _connection_record) -> None:
+    # Cheap when there is nothing to do; keeps sqlite_stat* fresh for the planner.
+    try:
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute("PRAGMA optimize")
+        finally:
+            cur.close()
+    except Exception:
+        pass
+
+
+if settings.database_url.startswith("sqlite"):
+    for _eng in (engine, async_engine.sync_engine):
+        event.listen(_eng, "connect", _set_sqlite_pragmas)
+        event.listen(_eng, "close", _optimize_sqlite_on_close)
+
+
 def _sqlite_column_names(conn, table: str) -> set[str]:
     rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
     # PRAGMA table_info columns: cid, name, type, notnull, dflt_value, pk
     return {r[1] for r in rows}
 
 
-def _sqlite_add_column_if_missing(conn, table: str, column: str, ddl: str) -> None:
-    cols = _sqlite_column_names(conn, table)
-    if column in cols:
+def _sqlite_add_column_if_missing(conn, cols: dict[str, set[str]], table: str, column: str, ddl: str) -> None:
+    if column in cols[table]:
         return
     conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+    cols[table].add(column)
 
 
 def _migrate_sqlite(conn) -> None:
     # NOTE: SQLite can't ALTER column types or add constraints easily.
     # We only do additive migrations for local/dev convenience.
     try:
-        _sqlite_add_column_if_missing(conn, "model", "project_id", "project_id VARCHAR")
-        _sqlite_add_column_if_missing(conn, "model", "tags_json", "tags_json TEXT DEFAULT '[]'")
-        _sqlite_add_column_if_missing(conn, "model", "notes", "notes TEXT")
-        _sqlite_add_column_if_missing(conn, "model", "archived_at", "archived_at DATETIME")
-
-        _sqlite_add_column_if_missing(conn, "generationjob", "source", "source VARCHAR DEFAULT 'api'")
-        _sqlite_add_column_if_missing(conn, "generationjob", "prompt_template_id", "prompt_template_id VARCHAR")
-        _sqlite_add_column_if_missing(conn, "generationjob", "params_json", "params_json TEXT DEFAULT '{}'")
+        # Introspect each table once; the helper keeps the sets current as columns are added.
+        cols = {t: _sqlite_column_names(conn, t) for t in ("model", "generationjob")}
+
+        _sqlite_add_column_if_missing(conn, cols, "model", "project_id", "project_id VARCHAR")
+        _sqlite_add_column_if_missing(conn, cols, "model", "tags_json", "tags_json TEXT DEFAULT '[]'")
+        _sqlite_add_column_if_missing(conn, cols, "model", "notes", "notes TEXT")
+        _sqlite_add_column_if_missing(conn, cols, "model", "archived_at", "archived_at DATETIME")
+
+        _sqlite_add_column_if_missing(conn, cols, "generationjob", "source", "source VARCHAR DEFAULT 'api'")
+        _sqlite_add_column_if_missing(
+            conn, cols, "generationjob", "prompt_template_id", "prompt_template_id VARCHAR"
+        )
+        _sqlite_add_column_if_missing(conn, cols, "generationjob", "params_json", "params_json TEXT DEFAULT '{}'")
+        _sqlite_add_column_if_missing(conn, cols, "generationjob", "dedup_key", "dedup_key VARCHAR")
     except Exception:
         # Best-effort; create_all already ran. If migration fails, app still boots.
         return
 
 
+def _create_missing_indexes(conn) -> None:
+    # create_all only emits indexes alongside brand-new tables; add ones declared after a table existed.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# Single-column indexes made redundant by composite indexes with the same leading column (see models.py).
+_REDUNDANT_INDEXES = ("ix_modelimage_model_id", "ix_generationjob_model_id", "ix_generationjob_status")
+
+
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
-    if settings.database_url.startswith("sqlite"):
-        with engine.begin() as conn:
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
             _migrate_sqlite(conn)
+        _create_missing_indexes(conn)
+        for name in _REDUNDANT_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        if engine.dialect.name == "postgresql":
+            # Expression indexes for the `tags_json::jsonb @> ...` tag filters.
+            for table in ("prompttemplate", "model"):
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_tags ON {table} "
+                    "USING gin ((tags_json::jsonb) jsonb_path_ops)"
+                )
+
+
+def optimize_sqlite() -> None:
+    """Run `PRAGMA optimize` (SQLite recommends doing this every few hours on long-lived connections)."""
+    if not settings.database_url.startswith("sqlite"):
+        return
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
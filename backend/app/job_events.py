@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import logging
+
+import orjson
+import redis.asyncio as aioredis
+
+from .settings import settings
+
+logger = logging.getLogger("backend")
+
+_CLIENT: aioredis.Redis | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    # One pooled client per process; each SSE watcher borrows a connection for its pub/sub subscription.
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = aioredis.Redis.from_url(settings.redis_url)
+    return _CLIENT
+
+
+def job_channel(job_id: str) -> str:
+    # Must match worker/worker/events.py, which publishes job state changes here.
+    return f"job:{job_id}"
+
+
+async def publish(job_id: str, event: dict) -> None:
+    """Best-effort: push an API-side job state change (e.g. a cancel) to open SSE streams."""
+    try:
+        await get_redis().publish(job_channel(job_id), orjson.dumps(event))
+    except Exception as e:
+        logger.warning("job=%s failed to publish event: %s", job_id, e)
+
+
+async def aclose() -> None:
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable
+
+from . import job_events
+
+logger = logging.getLogger("backend")
+
+_LEASE_PREFIX = "aia:leader:"
+_LEASE_TTL_MS = 15_000
+# Renew/release only while the lease is still ours, so a process whose lease lapsed can't touch the next leader's.
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+async def run_as_leader(name: str, jobs: list[Callable[[], Awaitable[None]]]) -> None:
+    """
+    Run `jobs` in a single process across every Uvicorn worker and replica sharing Redis.
+
+    Each process calls this; whichever holds the `aia:leader:<name>` lease (SET NX PX) runs the jobs and
+    renews the lease every third of its TTL, the others retry at the same interval. Losing the lease, or
+    Redis, cancels the jobs until it is reacquired.
+    """
+    key = _LEASE_PREFIX + name
+    token = uuid.uuid4().hex
+    interval_s = _LEASE_TTL_MS / 3000.0
+    while True:
+        r = job_events.get_redis()
+        try:
+            acquired = await r.set(key, token, nx=True, px=_LEASE_TTL_MS)
+        except Exception as e:
+            logger.warning("leader lease %s unavailable: %s", name, e)
+            acquired = False
+        if not acquired:
+            await asyncio.sleep(interval_s)
+            continue
+
+        logger.info("leader lease %s acquired", name)
+        tasks = [asyncio.create_task(job()) for job in jobs]
+        try:
+            while True:
+                await asyncio.sleep(interval_s)
+                if not await r.eval(_RENEW_SCRIPT, 1, key, token, _LEASE_TTL_MS):
+                    logger.warning("leader lease %s lost", name)
+                    break
+        except Exception as e:
+            logger.warning("leader lease %s renewal failed: %s", name, e)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await r.eval(_RELEASE_SCRIPT, 1, key, token)
+            except Exception:
+                pass
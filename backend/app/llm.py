@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 
 import httpx
 
@@ -13,18 +14,45 @@ class LlmResult:
     model: str
 
 
+# Provider config comes from env, which is fixed for the life of the process; read it once.
+@lru_cache(maxsize=1)
 def _provider() -> str:
     return (os.environ.get("LLM_PROVIDER") or "mock").strip().lower()
 
 
+@lru_cache(maxsize=1)
 def _ollama_base_url() -> str:
     return (os.environ.get("OLLAMA_BASE_URL") or "http://localhost:11434").strip().rstrip("/")
 
 
+@lru_cache(maxsize=1)
 def _ollama_model() -> str:
     return (os.environ.get("OLLAMA_MODEL") or "llama3.1").strip()
 
 
+@lru_cache(maxsize=1)
+def _timeout_s() -> float:
+    return float((os.environ.get("LLM_TIMEOUT_S") or "120").strip() or "120")
+
+
+_CLIENT: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    # One pooled client per process so calls reuse keep-alive connections to the provider.
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=16, max_connections=32))
+    return _CLIENT
+
+
+async def aclose() -> None:
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
 async def complete(prompt: str) -> LlmResult:
     prompt = (prompt or "").strip()
     if not prompt:
@@ -48,9 +76,7 @@ async def complete(prompt: str) -> LlmResult:
             "prompt": prompt,
             "stream": False,
         }
-        timeout_s = float((os.environ.get("LLM_TIMEOUT_S") or "120").strip() or "120")
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
-            r = await client.post(url, json=payload)
+        r = await _get_client().post(url, json=payload, timeout=_timeout_s())
         if r.status_code != 200:
             raise RuntimeError(f"Ollama error {r.status_code}: {(r.text or '')[:2000]}")
         data = r.json()
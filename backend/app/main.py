@@ -1,72 +1,121 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import hashlib
 import json
 import logging
+import operator
 import os
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, WebSocket, WebSocketDisconnect, Form, HTTPException, Request, Header, Response
+import orjson
+from fastapi import (
+    Depends,
+    FastAPI,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    Form,
+    HTTPException,
+    Request,
+    Header,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, StreamingResponse
-from sqlmodel import Session, select
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from celery.result import AsyncResult
+from celery import states as celery_states
 from pydantic import BaseModel
-from sqlalchemy import func
+from sqlalchemy import and_, cast, exists, func, insert, lambda_stmt
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
 from .settings import settings
-from .db import init_db, engine
+from .db import AsyncSessionLocal, async_engine, init_db, optimize_sqlite
 from .models import Model, ModelImage, GenerationJob, Project, PromptTemplate
 from .errors import error_envelope
+from .middleware import RequestIDMiddleware, SelectiveGZipMiddleware, UploadSizeLimitMiddleware
 from .storage import (
     ensure_dir,
     safe_suffix,
     save_upload_to_tmp,
+    UploadTooLargeError,
     strip_exif_and_resize_to_square_1024,
     make_public_rel_path,
 )
 from .celery_app import celery_app
+from . import job_events
+from . import leader
 from . import llm as llm_service
-from .runtime_env import resolve_gpu_server_status
+from . import runtime_env
 
 logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger("backend")
 
-app = FastAPI(title="AI Agency API", version="0.1.0")
+# orjson encodes responses several times faster than the stdlib encoder.
+app = FastAPI(title="AI Agency API", version="0.1.0", default_response_class=ORJSONResponse)
 
 if (settings.env or "").lower() == "prod":
-    allowed_hosts = [h.strip() for h in (settings.allowed_hosts or "").split(",") if h.strip()]
-    if allowed_hosts:
-        app.add_middleware(TrustedHostMiddleware, allowed_hosts=allowed_hosts)
+    if settings.allowed_hosts_list:
+        app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.allowed_hosts_list)
 
 _default_cors_origins = ["http://localhost:3000", "http://0.0.0.0:3000"]
-_cors_origins = [o.strip() for o in (settings.cors_origins or "").split(",") if o.strip()]
+_cors_origins = settings.cors_origins_list
 # If the env var is present-but-empty (common in compose/.env setups), fall back to dev defaults.
 if not _cors_origins:
     _cors_origins = _default_cors_origins
 _cors_allow_all = "*" in _cors_origins
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"] if _cors_allow_all else _cors_origins,
+_cors_config = {
+    "allow_origins": ["*"] if _cors_allow_all else _cors_origins,
     # Credentials + wildcard origin isn't valid CORS; default to no credentials when allow-all.
-    allow_credentials=False if _cors_allow_all else True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-STORAGE_DIR = Path(settings.storage_dir)
+    "allow_credentials": not _cors_allow_all,
+    "allow_methods": ["*"],
+    "allow_headers": ["*"],
+}
+
+# Up to 10 images per upload plus multipart framing; added first so CORS headers still wrap the 413.
+app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=10 * int(settings.max_upload_bytes) + (1 << 20))
+app.add_middleware(CORSMiddleware, **_cors_config)
+_CORS_DEBUG_PAYLOAD = {"cors_origins": tuple(_cors_origins), "allow_all": _cors_allow_all}
+# Added after CORS so it wraps it; model/job listings are multi-KB JSON. Stored images are served as-is.
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1024, exclude_paths=("/storage/",))
+# Outermost, so the access log duration covers the whole stack.
+app.add_middleware(RequestIDMiddleware)
+
+_STORAGE_DIR_STR = settings.storage_dir
+STORAGE_DIR = Path(_STORAGE_DIR_STR)
 MODELS_DIR = STORAGE_DIR / "models"
 OUTPUTS_DIR = STORAGE_DIR / "outputs"
 TMP_DIR = STORAGE_DIR / "tmp"
 
-_REQUEST_ID_HEADER = "x-request-id"
+_SSE_HEARTBEAT_S = 20.0
+_SSE_MAX_STREAM_S = 3600.0
+# Progress frames are coalesced to the newest one per flush; a client that can't take a frame within the
+# send timeout is disconnected rather than allowed to stall the handler.
+_WS_PROGRESS_FLUSH_S = 0.1
+_WS_SEND_TIMEOUT_S = 5.0
+_WS_EVENT_TIMEOUT_S = 30.0
+_CELERY_SYNC_STALE_S = 120.0
+_TERMINAL_STATUSES = frozenset({"complete", "error", "cancelled"})
+# A seeded request identical to one of these jobs reuses it; failed and cancelled jobs are run again.
+_DEDUP_STATUSES = ("queued", "running", "complete")
+# Sentinel model id for jobs created without a reference set (pure text-to-image).
+_TEXT2IMG_MODEL_ID = "__text2img__"
+_EMPTY_JSON_LIST = "[]"
+# Job columns the worker may set through job events (see worker/worker/events.py).
+_JOB_EVENT_FIELDS = ("status", "progress", "message", "output_url", "error_code", "error_message")
+
+# Strong refs to long-running startup tasks (asyncio only keeps weak refs).
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
 
 
 @app.on_event("startup")
@@ -78,59 +127,95 @@ def _startup() -> None:
     init_db()
 
 
-# Serve stored files (outputs + processed refs) for local dev.
-app.mount("/storage", StaticFiles(directory=str(STORAGE_DIR)), name="storage")
+async def _sqlite_optimize_loop(interval_s: float) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await asyncio.to_thread(optimize_sqlite)
+        except Exception as e:
+            logger.warning("sqlite optimize failed: %s", e)
 
 
-@app.middleware("http")
-async def request_id_middleware(request: Request, call_next):
-    rid = request.headers.get(_REQUEST_ID_HEADER) or uuid.uuid4().hex
-    request.state.request_id = rid
-    start = time.monotonic()
-    client = getattr(request, "client", None)
-    client_ip = getattr(client, "host", None)
-    method = request.method
-    path = request.url.path
+def _apply_job_event(job: GenerationJob, event: dict) -> None:
+    for key in _JOB_EVENT_FIELDS:
+        if key in event:
+            setattr(job, "output_rel_url" if key == "output_url" else key, event[key])
+    if event.get("mock"):
+        # Mock-fallback placeholder: never reuse it for an identical request once the GPU is back.
+        job.dedup_key = None
+    job.updated_at = _now()
 
-    try:
-        resp = await call_next(request)
-        return resp
-    finally:
-        # response headers + access log
-        duration_ms = (time.monotonic() - start) * 1000.0
+
+async def _mirror_job_events() -> None:
+    """Write worker job events into GenerationJob rows, so job reads don't need the Celery result backend."""
+    while True:
+        pubsub = job_events.get_redis().pubsub()
         try:
-            status_code = getattr(locals().get("resp", None), "status_code", None)
-        except Exception:
-            status_code = None
-        logger.info(
-            "rid=%s ip=%s %s %s status=%s dur_ms=%.1f",
-            rid,
-            client_ip,
-            method,
-            path,
-            status_code,
-            duration_ms,
-        )
+            await pubsub.psubscribe(job_events.job_channel("*"))
+            async for msg in pubsub.listen():
+                if msg["type"] != "pmessage":
+                    continue
+                job_id = msg["channel"].decode().split(":", 1)[1]
+                event = json.loads(msg["data"])
+                async with AsyncSessionLocal() as session:
+                    job = await session.get(GenerationJob, job_id)
+                    # WebSocket runs have no row; never overwrite a cancel with a late worker event.
+                    if not job or job.status in _TERMINAL_STATUSES:
+                        continue
+                    _apply_job_event(job, event)
+                    session.add(job)
+                    await session.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("job event mirror failed, resubscribing: %s", e)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
 
 
-@app.middleware("http")
-async def security_headers_middleware(request: Request, call_next):
-    # Keep security headers separate from request id + logging so we don't lose headers
-    # even if the request logging changes.
-    rid = getattr(getattr(request, "state", None), "request_id", None)
-    resp = await call_next(request)
-    if rid:
-        resp.headers[_REQUEST_ID_HEADER] = rid
-    # Basic security headers (lightweight; for full CSP, prefer a reverse proxy like Caddy/Nginx).
-    resp.headers.setdefault("X-Content-Type-Options", "nosniff")
-    resp.headers.setdefault("Referrer-Policy", "no-referrer")
-    resp.headers.setdefault("Cross-Origin-Resource-Policy", "same-site")
-    return resp
+@app.on_event("startup")
+async def _start_background_tasks() -> None:
+    # Every Uvicorn worker runs this hook; the lease keeps these jobs to one process per deployment.
+    jobs = [_mirror_job_events]
+    if settings.database_url.startswith("sqlite") and settings.sqlite_optimize_interval_s > 0:
+        jobs.append(functools.partial(_sqlite_optimize_loop, float(settings.sqlite_optimize_interval_s)))
+    _BACKGROUND_TASKS.add(asyncio.create_task(leader.run_as_leader("backend", jobs)))
+
+
+@app.on_event("shutdown")
+async def _stop_background_tasks() -> None:
+    for task in _BACKGROUND_TASKS:
+        task.cancel()
+    # Let the leader release its lease before the Redis client is closed.
+    await asyncio.gather(*_BACKGROUND_TASKS, return_exceptions=True)
+    _BACKGROUND_TASKS.clear()
+    await llm_service.aclose()
+    await job_events.aclose()
+    await runtime_env.aclose()
+    await async_engine.dispose()
+
+
+class ImmutableStaticFiles(StaticFiles):
+    # Stored files are named by uuid and never rewritten in place, so browsers can skip revalidation.
+    def file_response(self, *args, **kwargs) -> Response:
+        resp = super().file_response(*args, **kwargs)
+        if resp.status_code == 200:
+            resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return resp
+
+
+# Serve stored files (outputs + processed refs) for local dev.
+if settings.serve_storage:
+    app.mount("/storage", ImmutableStaticFiles(directory=_STORAGE_DIR_STR), name="storage")
 
 
 def _error_response(request: Request | None, *, code: str, message: str, status_code: int, details: dict | None = None):
     rid = getattr(getattr(request, "state", None), "request_id", None) if request else None
-    return JSONResponse(status_code=status_code, content=error_envelope(code=code, message=message, request_id=rid, details=details))
+    return ORJSONResponse(
+        status_code=status_code,
+        content=error_envelope(code=code, message=message, request_id=rid, details=details),
+    )
 
 
 @app.exception_handler(HTTPException)
@@ -151,7 +236,8 @@ def health() -> dict:
 
 @app.get("/v1/runtime")
 async def runtime_status() -> dict:
-    gpu = await resolve_gpu_server_status()
+    # The UI polls this; the status is cached briefly so polls don't each probe the GPU server.
+    gpu = await runtime_env.cached_gpu_server_status()
     return {
         "ok": True,
         "gpu_server": {
@@ -195,45 +281,131 @@ def debug_cors(
         expected = (settings.admin_api_key or "").strip()
         if expected and (x_api_key or "").strip() != expected:
             raise HTTPException(status_code=401, detail="Unauthorized")
-    return {"cors_origins": _cors_origins, "allow_all": _cors_allow_all}
+    return _CORS_DEBUG_PAYLOAD
+
+
+async def get_session():
+    async with AsyncSessionLocal() as session:
+        yield session
 
 
 def _now() -> datetime:
     return datetime.utcnow()
 
 
+# lambda_stmt caches the constructed statement and its cache key per call site; only the bound values change.
+_LIST_MODELS_STMT = lambda_stmt(lambda: select(Model).order_by(Model.created_at.desc()))
+
+
+def _model_images_query(model_id: str, image_ids: list[str] | None = None) -> StatementLambdaElement:
+    # Filter in SQL (served by ix_modelimage_model_created) instead of loading every image and filtering here.
+    stmt = lambda_stmt(lambda: select(ModelImage).where(ModelImage.model_id == model_id))
+    if image_ids:
+        stmt += lambda s: s.where(ModelImage.id.in_(image_ids))
+    stmt += lambda s: s.order_by(ModelImage.created_at.asc())
+    return stmt
+
+
+def _dedup_key(model_id: str, prompt: str, params: dict | None, image_ids: list[str]) -> str | None:
+    """Identity of a seeded generation request. Unseeded runs are meant to differ, so they never dedupe."""
+    if not isinstance(params, dict) or params.get("seed") is None:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    # Callers pass ids in canonical (created_at) order, so the same image set hashes the same however it was listed.
+    for part in (model_id, prompt, json.dumps(params, sort_keys=True, separators=(",", ":")), ",".join(image_ids)):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _tags_contain(tags_json_col, tag: str):
+    """SQL predicate: the JSON array stored in `tags_json_col` contains `tag`."""
+    if settings.database_url.startswith("sqlite"):
+        values = func.json_each(tags_json_col).table_valued("value")
+        return exists(select(1).select_from(values).where(values.c.value == tag))
+    # Postgres: jsonb containment, served by the GIN index created in init_db.
+    return cast(tags_json_col, JSONB).op("@>")(cast(json.dumps([tag]), JSONB))
+
+
+_JOB_FIELDS = operator.attrgetter(
+    "id",
+    "model_id",
+    "source",
+    "prompt_template_id",
+    "status",
+    "progress",
+    "message",
+    "prompt",
+    "image_ids_json",
+    "output_rel_url",
+    "error_code",
+    "error_message",
+    "created_at",
+    "updated_at",
+)
+
+
 def _job_public(job: GenerationJob) -> dict:
-    out_url = job.output_rel_url
+    # One C-level attrgetter call per row instead of 14 attribute lookups (list_jobs serializes up to 200 rows).
+    (
+        id_,
+        model_id,
+        source,
+        prompt_template_id,
+        status,
+        progress,
+        message,
+        prompt,
+        image_ids_json,
+        output_url,
+        error_code,
+        error_message,
+        created_at,
+        updated_at,
+    ) = _JOB_FIELDS(job)
     return {
-        "id": job.id,
-        "model_id": job.model_id,
-        "source": getattr(job, "source", None),
-        "prompt_template_id": getattr(job, "prompt_template_id", None),
-        "status": job.status,
-        "progress": job.progress,
-        "message": job.message,
-        "prompt": job.prompt,
-        "image_ids_json": job.image_ids_json,
-        "output_url": out_url,
-        "error_code": job.error_code,
-        "error_message": job.error_message,
-        "created_at": job.created_at.isoformat(),
-        "updated_at": job.updated_at.isoformat(),
+        "id": id_,
+        "model_id": model_id,
+        "source": source,
+        "prompt_template_id": prompt_template_id,
+        "status": status,
+        "progress": progress,
+        "message": message,
+        "prompt": prompt,
+        "image_ids_json": image_ids_json,
+        "output_url": output_url,
+        "error_code": error_code,
+        "error_message": error_message,
+        "created_at": created_at.isoformat(),
+        "updated_at": updated_at.isoformat(),
     }
 
 
-def _sync_job_from_celery(session: Session, job: GenerationJob) -> GenerationJob:
+def _celery_snapshot(task_id: str) -> tuple[str, object]:
+    """
+    Read a task's (state, info) from the result backend in one GET (blocking; call via `asyncio.to_thread`).
+
+    For successful tasks `info` is the return value; for failed ones, the exception.
+    """
+    meta = celery_app.backend.get_task_meta(task_id)
+    return meta["status"], meta.get("result")
+
+
+async def _sync_job_from_celery(session: AsyncSession, job: GenerationJob) -> GenerationJob:
     """
     Best-effort: reconcile DB job with Celery result state.
     """
     if not job.celery_task_id:
         return job
-    if job.status in {"complete", "error", "cancelled"}:
+    if job.status in _TERMINAL_STATUSES:
+        return job
+    # Worker events (applied by `_mirror_job_events`) keep rows current. Only rows that have gone quiet, e.g.
+    # because events were published while the API was down, are reconciled against the result backend.
+    if (_now() - job.updated_at).total_seconds() < _CELERY_SYNC_STALE_S:
         return job
 
-    ar = AsyncResult(job.celery_task_id, app=celery_app)
-    state = ar.state
-    info = ar.info if isinstance(ar.info, dict) else {}
+    state, raw_info = await asyncio.to_thread(_celery_snapshot, job.celery_task_id)
+    info = raw_info if isinstance(raw_info, dict) else {}
     prev_status = job.status
     prev_progress = job.progress
 
@@ -257,8 +429,7 @@ def _sync_job_from_celery(session: Session, job: GenerationJob) -> GenerationJob
             job.message = str(info.get("message") or "")
         job.updated_at = _now()
         session.add(job)
-        session.commit()
-        session.refresh(job)
+        await session.commit()
         if job.status != prev_status or job.progress != prev_progress:
             logger.info(
                 "job=%s task=%s state=%s status=%s progress=%s msg=%s",
@@ -271,39 +442,28 @@ def _sync_job_from_celery(session: Session, job: GenerationJob) -> GenerationJob
             )
         return job
 
-    if ar.ready():
-        if ar.successful():
-            try:
-                result = ar.get(timeout=1)
-            except Exception as e:
-                job.status = "error"
-                job.error_code = "result_fetch_failed"
-                job.error_message = str(e)
-                job.updated_at = _now()
-                session.add(job)
-                session.commit()
-                session.refresh(job)
-                return job
-
+    if state in celery_states.READY_STATES:
+        if state == celery_states.SUCCESS:
+            result = raw_info
             job.status = "complete"
             job.progress = 100
             job.message = "done"
             if isinstance(result, dict) and result.get("output_url"):
                 job.output_rel_url = str(result["output_url"])
+            if isinstance(result, dict) and result.get("mock"):
+                job.dedup_key = None
             job.updated_at = _now()
             session.add(job)
-            session.commit()
-            session.refresh(job)
+            await session.commit()
             logger.info("job=%s task=%s complete output=%s", job.id, job.celery_task_id, job.output_rel_url)
             return job
 
         job.status = "error"
         job.error_code = "celery_failed"
-        job.error_message = str(ar.result)
+        job.error_message = str(raw_info)
         job.updated_at = _now()
         session.add(job)
-        session.commit()
-        session.refresh(job)
+        await session.commit()
         logger.warning(
             "job=%s task=%s failed state=%s err=%s",
             job.id,
@@ -317,7 +477,7 @@ def _sync_job_from_celery(session: Session, job: GenerationJob) -> GenerationJob
 
 
 @app.post("/v1/generations", status_code=202)
-async def create_generation(request: Request) -> dict:
+async def create_generation(request: Request, session: AsyncSession = Depends(get_session)) -> dict:
     data = await request.json()
     rid = getattr(getattr(request, "state", None), "request_id", None)
     model_id = (data.get("model_id") or "").strip()
@@ -339,142 +499,187 @@ async def create_generation(request: Request) -> dict:
     if image_ids and not model_id:
         raise HTTPException(status_code=400, detail="model_id is required when image_ids are provided")
 
-    with Session(engine) as session:
-        # Optional model_id: allow pure text-to-image runs without any saved "reference set".
-        # We still persist a job record, so store a stable sentinel model id.
-        if not model_id:
-            selected: list[ModelImage] = []
-            image_paths: list[str] = []
-            canonical_ids: list[str] = []
-            model_id = "__text2img__"
-        else:
-            m = session.get(Model, model_id)
-            if not m:
-                raise HTTPException(status_code=404, detail="model not found")
-
-            q = select(ModelImage).where(ModelImage.model_id == model_id).order_by(ModelImage.created_at.asc())
-            all_images = list(session.exec(q))
+    # Optional model_id: allow pure text-to-image runs without any saved "reference set".
+    # We still persist a job record, so store a stable sentinel model id.
+    if not model_id:
+        selected: list[ModelImage] = []
+        image_paths: list[str] = []
+        canonical_ids: list[str] = []
+        model_id = _TEXT2IMG_MODEL_ID
+    else:
+        m = await session.get(Model, model_id)
+        if not m:
+            raise HTTPException(status_code=404, detail="model not found")
 
-            if image_ids:
-                selected = [img for img in all_images if img.id in set(image_ids)]
-            else:
-                selected = all_images
-
-            # Allow zero reference images (pure text-to-image).
-            image_paths = [str(STORAGE_DIR / img.rel_path) for img in selected]
-            canonical_ids = [img.id for img in selected]
-
-        job_id = uuid.uuid4().hex
-        job = GenerationJob(
-            id=job_id,
-            model_id=model_id,
-            prompt=prompt,
-            source=source,
-            prompt_template_id=prompt_template_id,
-            params_json=json.dumps(params) if isinstance(params, (dict, list)) else "{}",
-            image_ids_json=json.dumps(canonical_ids),
-            status="queued",
-            progress=0,
-            message="queued",
-            created_at=_now(),
-            updated_at=_now(),
-        )
-        session.add(job)
-        session.commit()
-        session.refresh(job)
+        selected = (await session.scalars(_model_images_query(model_id, image_ids))).all()
 
-        task = celery_app.send_task(
-            "worker.tasks.generate_consistent_image",
-            args=[job_id, prompt, image_paths, rid, params],
-        )
-        job.celery_task_id = task.id
-        job.updated_at = _now()
-        session.add(job)
-        session.commit()
-        session.refresh(job)
+        # Allow zero reference images (pure text-to-image).
+        image_paths = [str(STORAGE_DIR / img.rel_path) for img in selected]
+        canonical_ids = [img.id for img in selected]
 
-        logger.info(
-            "rid=%s enqueued job=%s task=%s model_id=%s refs=%d source=%s",
-            rid,
-            job.id,
-            task.id,
-            model_id,
-            len(image_paths),
-            source,
-        )
-        return {"job_id": job.id, "task_id": task.id, "request_id": rid}
+    dedup_key = _dedup_key(model_id, prompt, params, canonical_ids)
+    if dedup_key:
+        existing = (
+            await session.exec(
+                select(GenerationJob)
+                .where(GenerationJob.dedup_key == dedup_key, GenerationJob.status.in_(_DEDUP_STATUSES))
+                .limit(1)
+            )
+        ).first()
+        if existing:
+            logger.info("rid=%s reusing job=%s for identical seeded request", rid, existing.id)
+            return {"job_id": existing.id, "task_id": existing.celery_task_id, "request_id": rid, "deduplicated": True}
+
+    job_id = uuid.uuid4().hex
+    # Choose the task id up front so the row is written once, complete, before the task can emit events for it.
+    task_id = uuid.uuid4().hex
+    now = _now()
+    job = GenerationJob(
+        id=job_id,
+        model_id=model_id,
+        prompt=prompt,
+        source=source,
+        prompt_template_id=prompt_template_id,
+        params_json=json.dumps(params) if isinstance(params, (dict, list)) else "{}",
+        image_ids_json=json.dumps(canonical_ids) if canonical_ids else _EMPTY_JSON_LIST,
+        dedup_key=dedup_key,
+        celery_task_id=task_id,
+        status="queued",
+        progress=0,
+        message="queued",
+        created_at=now,
+        updated_at=now,
+    )
+    session.add(job)
+    await session.commit()
+
+    task = celery_app.send_task(
+        "worker.tasks.generate_consistent_image",
+        args=[job_id, prompt, image_paths, rid, params],
+        task_id=task_id,
+    )
+
+    logger.info(
+        "rid=%s enqueued job=%s task=%s model_id=%s refs=%d source=%s",
+        rid,
+        job.id,
+        task.id,
+        model_id,
+        len(image_paths),
+        source,
+    )
+    return {"job_id": job.id, "task_id": task.id, "request_id": rid}
 
 
 @app.get("/v1/generations/{job_id}")
-def get_generation(job_id: str) -> dict:
-    with Session(engine) as session:
-        job = session.get(GenerationJob, job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="generation not found")
-        job = _sync_job_from_celery(session, job)
-        return {"job": _job_public(job)}
+async def get_generation(job_id: str, session: AsyncSession = Depends(get_session)) -> dict:
+    job = await session.get(GenerationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="generation not found")
+    job = await _sync_job_from_celery(session, job)
+    return {"job": _job_public(job)}
 
 
 @app.get("/v1/models/{model_id}/generations")
-def list_generations(model_id: str, limit: int = 20) -> dict:
+async def list_generations(model_id: str, limit: int = 20, session: AsyncSession = Depends(get_session)) -> dict:
     limit = max(1, min(int(limit), 100))
-    with Session(engine) as session:
-        q = (
-            select(GenerationJob)
-            .where(GenerationJob.model_id == model_id)
-            .order_by(GenerationJob.created_at.desc())
-            .limit(limit)
-        )
-        jobs = list(session.exec(q))
-        return {"jobs": [_job_public(j) for j in jobs]}
+    q = (
+        select(GenerationJob)
+        .where(GenerationJob.model_id == model_id)
+        .order_by(GenerationJob.created_at.desc())
+        .limit(limit)
+    )
+    jobs = (await session.exec(q)).all()
+    return {"jobs": [_job_public(j) for j in jobs]}
 
 
 @app.post("/v1/generations/{job_id}/cancel")
-def cancel_generation(job_id: str) -> dict:
-    with Session(engine) as session:
-        job = session.get(GenerationJob, job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="generation not found")
-        if job.status in {"complete", "error", "cancelled"}:
-            return {"job": _job_public(job)}
-        if job.celery_task_id:
-            try:
-                celery_app.control.revoke(job.celery_task_id, terminate=False)
-            except Exception:
-                pass
-        job.status = "cancelled"
-        job.message = "cancelled"
-        job.updated_at = _now()
-        session.add(job)
-        session.commit()
-        session.refresh(job)
+async def cancel_generation(job_id: str, session: AsyncSession = Depends(get_session)) -> dict:
+    job = await session.get(GenerationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="generation not found")
+    if job.status in _TERMINAL_STATUSES:
         return {"job": _job_public(job)}
+    if job.celery_task_id:
+        try:
+            await asyncio.to_thread(celery_app.control.revoke, job.celery_task_id, terminate=False)
+        except Exception:
+            pass
+    job.status = "cancelled"
+    job.message = "cancelled"
+    job.updated_at = _now()
+    session.add(job)
+    await session.commit()
+    # Open SSE streams only re-read the row on heartbeats; tell them now.
+    await job_events.publish(job_id, {"status": "cancelled", "message": "cancelled"})
+    return {"job": _job_public(job)}
 
 
 @app.get("/v1/generations/{job_id}/events")
 async def generation_events(job_id: str):
+    row: GenerationJob | None = None
+
+    async def _load(session: AsyncSession) -> dict | None:
+        # One session per stream: the first call loads the row, later keep-alive checks just refresh it.
+        nonlocal row
+        if row is None:
+            row = await session.get(GenerationJob, job_id)
+            if row is None:
+                return None
+        else:
+            await session.refresh(row)
+        row = await _sync_job_from_celery(session, row)
+        # End the read transaction so the connection returns to the pool while we wait on pub/sub.
+        await session.commit()
+        return _job_public(row)
+
+    def _frame(job: dict) -> bytes:
+        # orjson emits compact UTF-8 bytes, which StreamingResponse sends without another encode.
+        return b"event: job\ndata: " + orjson.dumps({"type": "job", "job": job}) + b"\n\n"
+
     async def gen():
-        last_payload = None
-        while True:
-            with Session(engine) as session:
-                job = session.get(GenerationJob, job_id)
-                if not job:
-                    payload = {"type": "error", "message": "generation not found"}
-                    yield f"event: error\ndata: {json.dumps(payload)}\n\n"
-                    return
-                job = _sync_job_from_celery(session, job)
-                payload = {"type": "job", "job": _job_public(job)}
-
-            raw = json.dumps(payload, separators=(",", ":"))
-            if raw != last_payload:
-                yield f"event: job\ndata: {raw}\n\n"
-                last_payload = raw
-
-            if payload["job"]["status"] in {"complete", "error", "cancelled"}:
+        # Bound the stream's lifetime; EventSource clients reconnect on their own.
+        deadline = time.monotonic() + _SSE_MAX_STREAM_S
+        # Subscribe before the initial read so a transition in between isn't lost.
+        pubsub = job_events.get_redis().pubsub()
+        await pubsub.subscribe(job_events.job_channel(job_id))
+        session = AsyncSessionLocal()
+        try:
+            job = await _load(session)
+            if job is None:
+                payload = {"type": "error", "message": "generation not found"}
+                yield b"event: error\ndata: " + orjson.dumps(payload) + b"\n\n"
                 return
-
-            # Keep-alive + backoff.
-            await asyncio.sleep(1)
+            last_frame = _frame(job)
+            yield last_frame
+
+            while job["status"] not in _TERMINAL_STATUSES and time.monotonic() < deadline:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=_SSE_HEARTBEAT_S)
+                if msg is None:
+                    # Proxy keep-alive. Pub/sub is fire-and-forget, so also re-check the row in case an event was lost.
+                    yield b": keepalive\n\n"
+                    latest = await _load(session)
+                    if latest is None:
+                        return
+                    job = latest
+                else:
+                    event = orjson.loads(msg["data"])
+                    job = {**job, **{k: event[k] for k in _JOB_EVENT_FIELDS if k in event}}
+                    if job["status"] in _TERMINAL_STATUSES:
+                        # The row decides how a job ended: a cancel wins over a late worker "complete".
+                        latest = await _load(session)
+                        if latest is None:
+                            return
+                        if latest["status"] in _TERMINAL_STATUSES:
+                            job = latest
+                frame = _frame(job)
+                if frame != last_frame:
+                    yield frame
+                    last_frame = frame
+        finally:
+            await session.close()
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
 
     return StreamingResponse(gen(), media_type="text/event-stream")
 
@@ -491,52 +696,60 @@ class UpdateProjectIn(BaseModel):
 
 
 @app.post("/v1/projects", status_code=201)
-def create_project(payload: CreateProjectIn) -> Project:
+async def create_project(payload: CreateProjectIn, session: AsyncSession = Depends(get_session)) -> Project:
     project_id = (payload.id or "").strip()
     if not project_id:
         raise HTTPException(status_code=400, detail="project id required")
-    with Session(engine) as session:
-        existing = session.get(Project, project_id)
-        if existing:
-            raise HTTPException(status_code=409, detail="project already exists")
-        p = Project(id=project_id, name=(payload.name or "").strip() or project_id, description=(payload.description or None))
-        session.add(p)
-        session.commit()
-        session.refresh(p)
-        return p
+    existing = await session.get(Project, project_id)
+    if existing:
+        raise HTTPException(status_code=409, detail="project already exists")
+    p = Project(
+        id=project_id,
+        name=(payload.name or "").strip() or project_id,
+        description=(payload.description or None),
+    )
+    session.add(p)
+    await session.commit()
+    return p
 
 
 @app.get("/v1/projects")
-def list_projects() -> list[Project]:
-    with Session(engine) as session:
-        return list(session.exec(select(Project).order_by(Project.created_at.desc())))
+async def list_projects(session: AsyncSession = Depends(get_session)) -> list[Project]:
+    return (await session.exec(select(Project).order_by(Project.created_at.desc()))).all()
 
 
 @app.get("/v1/projects/{project_id}")
-def get_project(project_id: str) -> dict:
-    with Session(engine) as session:
-        p = session.get(Project, project_id)
-        if not p:
-            raise HTTPException(status_code=404, detail="project not found")
-        models = list(session.exec(select(Model).where(Model.project_id == project_id).order_by(Model.created_at.desc())))
-        prompts = list(session.exec(select(PromptTemplate).where(PromptTemplate.project_id == project_id).order_by(PromptTemplate.created_at.desc())))
-        return {"project": p, "models": models, "prompts": prompts}
+async def get_project(project_id: str, session: AsyncSession = Depends(get_session)) -> dict:
+    p = await session.get(Project, project_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="project not found")
+    models = (
+        await session.exec(select(Model).where(Model.project_id == project_id).order_by(Model.created_at.desc()))
+    ).all()
+    prompts = (
+        await session.exec(
+            select(PromptTemplate)
+            .where(PromptTemplate.project_id == project_id)
+            .order_by(PromptTemplate.created_at.desc())
+        )
+    ).all()
+    return {"project": p, "models": models, "prompts": prompts}
 
 
 @app.patch("/v1/projects/{project_id}")
-def update_project(project_id: str, payload: UpdateProjectIn) -> Project:
-    with Session(engine) as session:
-        p = session.get(Project, project_id)
-        if not p:
-            raise HTTPException(status_code=404, detail="project not found")
-        if payload.name is not None:
-            p.name = payload.name.strip() or p.name
-        if payload.description is not None:
-            p.description = payload.description
-        session.add(p)
-        session.commit()
-        session.refresh(p)
-        return p
+async def update_project(
+    project_id: str, payload: UpdateProjectIn, session: AsyncSession = Depends(get_session)
+) -> Project:
+    p = await session.get(Project, project_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="project not found")
+    if payload.name is not None:
+        p.name = payload.name.strip() or p.name
+    if payload.description is not None:
+        p.description = payload.description
+    session.add(p)
+    await session.commit()
+    return p
 
 
 class CreatePromptIn(BaseModel):
@@ -557,97 +770,89 @@ class UpdatePromptIn(BaseModel):
 
 
 @app.post("/v1/prompts", status_code=201)
-def create_prompt(payload: CreatePromptIn) -> PromptTemplate:
+async def create_prompt(payload: CreatePromptIn, session: AsyncSession = Depends(get_session)) -> PromptTemplate:
     prompt_id = (payload.id or "").strip()
     if not prompt_id:
         raise HTTPException(status_code=400, detail="prompt id required")
-    with Session(engine) as session:
-        existing = session.get(PromptTemplate, prompt_id)
-        if existing:
-            raise HTTPException(status_code=409, detail="prompt already exists")
-        rec = PromptTemplate(
-            id=prompt_id,
-            name=(payload.name or "").strip() or prompt_id,
-            template=(payload.template or "").strip(),
-            notes=payload.notes,
-            tags_json=json.dumps(payload.tags or []),
-            project_id=(payload.project_id or None),
-            created_at=_now(),
-            updated_at=_now(),
-        )
-        session.add(rec)
-        session.commit()
-        session.refresh(rec)
-        return rec
+    existing = await session.get(PromptTemplate, prompt_id)
+    if existing:
+        raise HTTPException(status_code=409, detail="prompt already exists")
+    now = _now()
+    rec = PromptTemplate(
+        id=prompt_id,
+        name=(payload.name or "").strip() or prompt_id,
+        template=(payload.template or "").strip(),
+        notes=payload.notes,
+        tags_json=json.dumps(payload.tags or []),
+        project_id=(payload.project_id or None),
+        created_at=now,
+        updated_at=now,
+    )
+    session.add(rec)
+    await session.commit()
+    return rec
 
 
 @app.get("/v1/prompts")
-def list_prompts(q: str | None = None, project_id: str | None = None, tag: str | None = None, limit: int = 100) -> list[PromptTemplate]:
+async def list_prompts(
+    q: str | None = None,
+    project_id: str | None = None,
+    tag: str | None = None,
+    limit: int = 100,
+    session: AsyncSession = Depends(get_session),
+) -> list[PromptTemplate]:
     limit = max(1, min(int(limit), 500))
-    with Session(engine) as session:
-        stmt = select(PromptTemplate)
-        if project_id:
-            stmt = stmt.where(PromptTemplate.project_id == project_id)
-        if q:
-            q2 = f"%{q.strip()}%"
-            stmt = stmt.where((PromptTemplate.name.ilike(q2)) | (PromptTemplate.template.ilike(q2)))
-        stmt = stmt.order_by(PromptTemplate.updated_at.desc()).limit(limit)
-        prompts = list(session.exec(stmt))
-        if tag:
-            t = tag.strip()
-            filtered = []
-            for p in prompts:
-                try:
-                    tags = set(json.loads(p.tags_json or "[]"))
-                except Exception:
-                    tags = set()
-                if t in tags:
-                    filtered.append(p)
-            prompts = filtered
-        return prompts
+    stmt = select(PromptTemplate)
+    if project_id:
+        stmt = stmt.where(PromptTemplate.project_id == project_id)
+    if q:
+        q2 = f"%{q.strip()}%"
+        stmt = stmt.where((PromptTemplate.name.ilike(q2)) | (PromptTemplate.template.ilike(q2)))
+    if tag:
+        stmt = stmt.where(_tags_contain(PromptTemplate.tags_json, tag.strip()))
+    stmt = stmt.order_by(PromptTemplate.updated_at.desc()).limit(limit)
+    return (await session.exec(stmt)).all()
 
 
 @app.get("/v1/prompts/{prompt_id}")
-def get_prompt(prompt_id: str) -> PromptTemplate:
-    with Session(engine) as session:
-        p = session.get(PromptTemplate, prompt_id)
-        if not p:
-            raise HTTPException(status_code=404, detail="prompt not found")
-        return p
+async def get_prompt(prompt_id: str, session: AsyncSession = Depends(get_session)) -> PromptTemplate:
+    p = await session.get(PromptTemplate, prompt_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="prompt not found")
+    return p
 
 
 @app.patch("/v1/prompts/{prompt_id}")
-def update_prompt(prompt_id: str, payload: UpdatePromptIn) -> PromptTemplate:
-    with Session(engine) as session:
-        p = session.get(PromptTemplate, prompt_id)
-        if not p:
-            raise HTTPException(status_code=404, detail="prompt not found")
-        if payload.name is not None:
-            p.name = payload.name.strip() or p.name
-        if payload.template is not None:
-            p.template = payload.template
-        if payload.notes is not None:
-            p.notes = payload.notes
-        if payload.project_id is not None:
-            p.project_id = payload.project_id
-        if payload.tags is not None:
-            p.tags_json = json.dumps(payload.tags or [])
-        p.updated_at = _now()
-        session.add(p)
-        session.commit()
-        session.refresh(p)
-        return p
+async def update_prompt(
+    prompt_id: str, payload: UpdatePromptIn, session: AsyncSession = Depends(get_session)
+) -> PromptTemplate:
+    p = await session.get(PromptTemplate, prompt_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="prompt not found")
+    if payload.name is not None:
+        p.name = payload.name.strip() or p.name
+    if payload.template is not None:
+        p.template = payload.template
+    if payload.notes is not None:
+        p.notes = payload.notes
+    if payload.project_id is not None:
+        p.project_id = payload.project_id
+    if payload.tags is not None:
+        p.tags_json = json.dumps(payload.tags or [])
+    p.updated_at = _now()
+    session.add(p)
+    await session.commit()
+    return p
 
 
 @app.delete("/v1/prompts/{prompt_id}", status_code=204, response_class=Response)
-def delete_prompt(prompt_id: str) -> Response:
-    with Session(engine) as session:
-        p = session.get(PromptTemplate, prompt_id)
-        if not p:
-            return Response(status_code=204)
-        session.delete(p)
-        session.commit()
+async def delete_prompt(prompt_id: str, session: AsyncSession = Depends(get_session)) -> Response:
+    p = await session.get(PromptTemplate, prompt_id)
+    if not p:
         return Response(status_code=204)
+    await session.delete(p)
+    await session.commit()
+    return Response(status_code=204)
 
 
 class UpdateModelIn(BaseModel):
@@ -659,246 +864,345 @@ class UpdateModelIn(BaseModel):
 
 
 @app.get("/v1/models")
-def list_models_v1(q: str | None = None, project_id: str | None = None, archived: bool = False, limit: int = 200) -> list[dict]:
+async def list_models_v1(
+    q: str | None = None,
+    project_id: str | None = None,
+    tag: str | None = None,
+    archived: bool = False,
+    limit: int = 200,
+    session: AsyncSession = Depends(get_session),
+) -> list[dict]:
     limit = max(1, min(int(limit), 500))
-    with Session(engine) as session:
-        stmt = select(Model)
-        if project_id:
-            stmt = stmt.where(Model.project_id == project_id)
-        if not archived:
-            stmt = stmt.where(Model.archived_at.is_(None))
-        if q:
-            q2 = f"%{q.strip()}%"
-            stmt = stmt.where((Model.id.ilike(q2)) | (Model.display_name.ilike(q2)))
-        stmt = stmt.order_by(Model.created_at.desc()).limit(limit)
-        models = list(session.exec(stmt))
-
-        out: list[dict] = []
-        for m in models:
-            raw_count = session.exec(select(func.count()).select_from(ModelImage).where(ModelImage.model_id == m.id)).one()
-            # Depending on SQLAlchemy/SQLModel version, `.one()` may yield an int or a 1-tuple.
-            ref_count = int(raw_count[0] if isinstance(raw_count, (tuple, list)) else raw_count)
-            last_job = session.exec(
-                select(GenerationJob).where(GenerationJob.model_id == m.id).order_by(GenerationJob.created_at.desc()).limit(1)
-            ).first()
-            out.append(
-                {
-                    "model": m,
-                    "ref_count": ref_count,
-                    "last_job": _job_public(last_job) if last_job else None,
-                }
-            )
-        return out
+    # One round trip: image counts via GROUP BY, most recent job via ROW_NUMBER() per model.
+    counts = (
+        select(ModelImage.model_id, func.count().label("ref_count")).group_by(ModelImage.model_id).subquery()
+    )
+    ranked = select(
+        GenerationJob,
+        func.row_number()
+        .over(partition_by=GenerationJob.model_id, order_by=GenerationJob.created_at.desc())
+        .label("rn"),
+    ).subquery()
+    last_job_alias = aliased(GenerationJob, ranked)
+    stmt = (
+        select(Model, func.coalesce(counts.c.ref_count, 0), last_job_alias)
+        .outerjoin(counts, counts.c.model_id == Model.id)
+        .outerjoin(last_job_alias, and_(last_job_alias.model_id == Model.id, ranked.c.rn == 1))
+    )
+    if project_id:
+        stmt = stmt.where(Model.project_id == project_id)
+    if not archived:
+        stmt = stmt.where(Model.archived_at.is_(None))
+    if q:
+        q2 = f"%{q.strip()}%"
+        stmt = stmt.where((Model.id.ilike(q2)) | (Model.display_name.ilike(q2)))
+    if tag:
+        stmt = stmt.where(_tags_contain(Model.tags_json, tag.strip()))
+    stmt = stmt.order_by(Model.created_at.desc()).limit(limit)
+    rows = (await session.exec(stmt)).all()
+
+    out: list[dict] = []
+    for m, ref_count, last_job in rows:
+        out.append(
+            {
+                "model": m,
+                "ref_count": int(ref_count),
+                "last_job": _job_public(last_job) if last_job else None,
+            }
+        )
+    return out
 
 
 @app.patch("/v1/models/{model_id}")
-def update_model_v1(model_id: str, payload: UpdateModelIn) -> Model:
-    with Session(engine) as session:
-        m = session.get(Model, model_id)
-        if not m:
-            raise HTTPException(status_code=404, detail="model not found")
-        if payload.display_name is not None:
-            m.display_name = payload.display_name.strip() or m.display_name
-        if payload.project_id is not None:
-            m.project_id = payload.project_id or None
-        if payload.tags is not None:
-            m.tags_json = json.dumps(payload.tags or [])
-        if payload.notes is not None:
-            m.notes = payload.notes
-        if payload.archived is not None:
-            m.archived_at = _now() if payload.archived else None
-        session.add(m)
-        session.commit()
-        session.refresh(m)
-        return m
+async def update_model_v1(model_id: str, payload: UpdateModelIn, session: AsyncSession = Depends(get_session)) -> Model:
+    m = await session.get(Model, model_id)
+    if not m:
+        raise HTTPException(status_code=404, detail="model not found")
+    if payload.display_name is not None:
+        m.display_name = payload.display_name.strip() or m.display_name
+    if payload.project_id is not None:
+        m.project_id = payload.project_id or None
+    if payload.tags is not None:
+        m.tags_json = json.dumps(payload.tags or [])
+    if payload.notes is not None:
+        m.notes = payload.notes
+    if payload.archived is not None:
+        m.archived_at = _now() if payload.archived else None
+    session.add(m)
+    await session.commit()
+    return m
 
 
 @app.delete("/v1/models/{model_id}/images/{image_id}", status_code=204, response_class=Response)
-def delete_model_image(model_id: str, image_id: str) -> Response:
-    with Session(engine) as session:
-        img = session.get(ModelImage, image_id)
-        if not img or img.model_id != model_id:
-            return Response(status_code=204)
-        # best-effort delete file
-        try:
-            p = STORAGE_DIR / img.rel_path
-            p.unlink(missing_ok=True)
-        except Exception:
-            pass
-        session.delete(img)
-        session.commit()
+async def delete_model_image(model_id: str, image_id: str, session: AsyncSession = Depends(get_session)) -> Response:
+    img = await session.get(ModelImage, image_id)
+    if not img or img.model_id != model_id:
         return Response(status_code=204)
+    # best-effort delete file
+    try:
+        p = STORAGE_DIR / img.rel_path
+        p.unlink(missing_ok=True)
+    except Exception:
+        pass
+    await session.delete(img)
+    await session.commit()
+    return Response(status_code=204)
 
 
 @app.get("/v1/jobs")
-def list_jobs(status: str | None = None, model_id: str | None = None, source: str | None = None, limit: int = 50, offset: int = 0) -> dict:
+async def list_jobs(
+    status: str | None = None,
+    model_id: str | None = None,
+    source: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    session: AsyncSession = Depends(get_session),
+) -> dict:
     limit = max(1, min(int(limit), 200))
     offset = max(0, int(offset))
-    with Session(engine) as session:
-        stmt = select(GenerationJob)
-        if status:
-            stmt = stmt.where(GenerationJob.status == status)
-        if model_id:
-            stmt = stmt.where(GenerationJob.model_id == model_id)
-        if source:
-            stmt = stmt.where(GenerationJob.source == source)
-        stmt = stmt.order_by(GenerationJob.created_at.desc()).offset(offset).limit(limit)
-        jobs = list(session.exec(stmt))
-        # Sync a small page with celery state for freshness.
-        out = []
-        for j in jobs:
-            j = _sync_job_from_celery(session, j)
-            out.append(_job_public(j))
-        return {"jobs": out, "limit": limit, "offset": offset}
+    stmt = select(GenerationJob)
+    if status:
+        stmt = stmt.where(GenerationJob.status == status)
+    if model_id:
+        stmt = stmt.where(GenerationJob.model_id == model_id)
+    if source:
+        stmt = stmt.where(GenerationJob.source == source)
+    stmt = stmt.order_by(GenerationJob.created_at.desc()).offset(offset).limit(limit)
+    jobs = (await session.exec(stmt)).all()
+    # Sync a small page with celery state for freshness.
+    out = []
+    for j in jobs:
+        j = await _sync_job_from_celery(session, j)
+        out.append(_job_public(j))
+    return {"jobs": out, "limit": limit, "offset": offset}
 
 
 @app.post("/v1/jobs/{job_id}/retry", status_code=202)
-def retry_job(job_id: str) -> dict:
-    with Session(engine) as session:
-        old = session.get(GenerationJob, job_id)
-        if not old:
-            raise HTTPException(status_code=404, detail="job not found")
-        model_id = old.model_id
-        m = session.get(Model, model_id)
-        if not m:
-            raise HTTPException(status_code=404, detail="model not found")
-
-        try:
-            image_ids = json.loads(old.image_ids_json or "[]")
-        except Exception:
-            image_ids = []
+async def retry_job(job_id: str, session: AsyncSession = Depends(get_session)) -> dict:
+    old = await session.get(GenerationJob, job_id)
+    if not old:
+        raise HTTPException(status_code=404, detail="job not found")
+    model_id = old.model_id
+    m = await session.get(Model, model_id)
+    if not m:
+        raise HTTPException(status_code=404, detail="model not found")
 
-        q = select(ModelImage).where(ModelImage.model_id == model_id).order_by(ModelImage.created_at.asc())
-        all_images = list(session.exec(q))
-        if image_ids:
-            selected = [img for img in all_images if img.id in set(image_ids)]
-        else:
-            selected = all_images
-        # Allow zero reference images (pure text-to-image).
-        image_paths = [str(STORAGE_DIR / img.rel_path) for img in selected]
-        canonical_ids = [img.id for img in selected]
-
-        new_id = uuid.uuid4().hex
-        job = GenerationJob(
-            id=new_id,
-            model_id=model_id,
-            prompt=old.prompt,
-            source=old.source or "api",
-            prompt_template_id=old.prompt_template_id,
-            params_json=old.params_json or "{}",
-            image_ids_json=json.dumps(canonical_ids),
-            status="queued",
-            progress=0,
-            message="queued",
-            created_at=_now(),
-            updated_at=_now(),
-        )
-        session.add(job)
-        session.commit()
-        session.refresh(job)
-
-        task = celery_app.send_task(
-            "worker.tasks.generate_consistent_image",
-            args=[new_id, old.prompt, image_paths, None, json.loads(old.params_json or "{}")],
-        )
-        job.celery_task_id = task.id
-        job.updated_at = _now()
-        session.add(job)
-        session.commit()
-        session.refresh(job)
-
-        return {"job": _job_public(job)}
+    try:
+        image_ids = json.loads(old.image_ids_json or "[]")
+    except Exception:
+        image_ids = []
+
+    selected = (await session.scalars(_model_images_query(model_id, image_ids))).all()
+    # Allow zero reference images (pure text-to-image).
+    image_paths = [str(STORAGE_DIR / img.rel_path) for img in selected]
+    canonical_ids = [img.id for img in selected]
+    params = json.loads(old.params_json or "{}")
+
+    new_id = uuid.uuid4().hex
+    task_id = uuid.uuid4().hex
+    now = _now()
+    job = GenerationJob(
+        id=new_id,
+        model_id=model_id,
+        prompt=old.prompt,
+        source=old.source or "api",
+        prompt_template_id=old.prompt_template_id,
+        params_json=old.params_json or "{}",
+        image_ids_json=json.dumps(canonical_ids) if canonical_ids else _EMPTY_JSON_LIST,
+        # Recomputed rather than copied: a mock-fallback job has had its key cleared.
+        dedup_key=_dedup_key(model_id, old.prompt, params, canonical_ids),
+        celery_task_id=task_id,
+        status="queued",
+        progress=0,
+        message="queued",
+        created_at=now,
+        updated_at=now,
+    )
+    session.add(job)
+    await session.commit()
+
+    celery_app.send_task(
+        "worker.tasks.generate_consistent_image",
+        args=[new_id, old.prompt, image_paths, None, params],
+        task_id=task_id,
+    )
+
+    return {"job": _job_public(job)}
 
 
 @app.post("/models")
-def create_model(id: str = Form(...), display_name: str = Form(...)) -> Model:
+async def create_model(
+    id: str = Form(...), display_name: str = Form(...), session: AsyncSession = Depends(get_session)
+) -> Model:
     model_id = id.strip()
     if not model_id:
         raise HTTPException(status_code=400, detail="Model id required")
 
-    with Session(engine) as session:
-        existing = session.get(Model, model_id)
-        if existing:
-            raise HTTPException(status_code=409, detail="Model already exists")
-        m = Model(id=model_id, display_name=display_name.strip() or model_id)
-        session.add(m)
-        session.commit()
-        session.refresh(m)
-        return m
+    existing = await session.get(Model, model_id)
+    if existing:
+        raise HTTPException(status_code=409, detail="Model already exists")
+    m = Model(id=model_id, display_name=display_name.strip() or model_id)
+    session.add(m)
+    await session.commit()
+    return m
 
 
 @app.get("/models")
-def list_models() -> list[Model]:
-    with Session(engine) as session:
-        return list(session.exec(select(Model).order_by(Model.created_at.desc())))
+async def list_models(session: AsyncSession = Depends(get_session)) -> list[Model]:
+    return (await session.scalars(_LIST_MODELS_STMT)).all()
 
 
 @app.get("/models/{model_id}")
-def get_model(model_id: str) -> dict:
-    with Session(engine) as session:
-        m = session.get(Model, model_id)
-        if not m:
-            raise HTTPException(status_code=404, detail="Model not found")
-        images = list(session.exec(select(ModelImage).where(ModelImage.model_id == model_id).order_by(ModelImage.created_at.asc())))
-        return {"model": m, "images": images}
+async def get_model(model_id: str, session: AsyncSession = Depends(get_session)) -> dict:
+    m = await session.get(Model, model_id)
+    if not m:
+        raise HTTPException(status_code=404, detail="Model not found")
+    images = (await session.scalars(_model_images_query(model_id))).all()
+    return {"model": m, "images": images}
+
+
+def _process_upload(f: UploadFile, model_id: str) -> ModelImage:
+    """Copies one upload to disk and normalizes it (runs in a worker thread; no DB access)."""
+    suffix = safe_suffix(f.filename or "upload.jpg")
+    f.file.seek(0)
+    # `f.size` is unknown for chunked uploads, so the limit is also enforced while streaming.
+    tmp_path = save_upload_to_tmp(f.file, TMP_DIR, suffix, max_bytes=int(settings.max_upload_bytes))
+    try:
+        image_id = f"img_{model_id}_{Path(tmp_path).stem}"
+        rel_path = make_public_rel_path("models", model_id, f"{image_id}.jpg")
+        dst_path = STORAGE_DIR / rel_path
+
+        w, h = strip_exif_and_resize_to_square_1024(tmp_path, dst_path)
+    finally:
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+    return ModelImage(
+        id=image_id,
+        model_id=model_id,
+        filename=(f.filename or f"{image_id}.jpg"),
+        rel_path=rel_path,
+        width=w,
+        height=h,
+    )
 
 
 @app.post("/models/{model_id}/images")
-async def upload_model_images(model_id: str, files: list[UploadFile]) -> dict:
+async def upload_model_images(
+    model_id: str, files: list[UploadFile], session: AsyncSession = Depends(get_session)
+) -> dict:
     if not files:
         raise HTTPException(status_code=400, detail="No files")
     if len(files) > 10:
         raise HTTPException(status_code=400, detail="Max 10 images")
 
-    with Session(engine) as session:
-        m = session.get(Model, model_id)
-        if not m:
-            raise HTTPException(status_code=404, detail="Model not found")
-
-        saved: list[ModelImage] = []
-        for f in files:
-            raw = await f.read()
-            if len(raw) > int(settings.max_upload_bytes):
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"Image too large (>{int(settings.max_upload_bytes)} bytes): {f.filename}",
-                )
-            suffix = safe_suffix(f.filename or "upload.jpg")
-            tmp_path = save_upload_to_tmp(raw, TMP_DIR, suffix)
-
-            image_id = f"img_{model_id}_{Path(tmp_path).stem}"
-            rel_path = make_public_rel_path("models", model_id, f"{image_id}.jpg")
-            dst_path = STORAGE_DIR / rel_path
-
-            w, h = strip_exif_and_resize_to_square_1024(tmp_path, dst_path)
-
-            rec = ModelImage(
-                id=image_id,
-                model_id=model_id,
-                filename=(f.filename or f"{image_id}.jpg"),
-                rel_path=rel_path,
-                width=w,
-                height=h,
+    m = await session.get(Model, model_id)
+    if not m:
+        raise HTTPException(status_code=404, detail="Model not found")
+
+    for f in files:
+        if f.size is not None and f.size > int(settings.max_upload_bytes):
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large (>{int(settings.max_upload_bytes)} bytes): {f.filename}",
             )
-            session.add(rec)
-            saved.append(rec)
 
-            try:
-                tmp_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+    # Pillow releases the GIL while decoding/encoding, so the resizes genuinely run in parallel.
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_process_upload, f, model_id) for f in files), return_exceptions=True
+    )
+    saved: list[ModelImage] = [r for r in results if isinstance(r, ModelImage)]
+    failed = [(f, r) for f, r in zip(files, results) if isinstance(r, BaseException)]
+    if failed:
+        # All-or-nothing: drop files already written for this request.
+        for img in saved:
+            (STORAGE_DIR / img.rel_path).unlink(missing_ok=True)
+        f, err = failed[0]
+        if isinstance(err, UploadTooLargeError):
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large (>{int(settings.max_upload_bytes)} bytes): {f.filename}",
+            )
+        raise err
+    # Threads finish in any order; stamp created_at in upload order, since it defines @image1..@imageN.
+    base = _now()
+    for idx, img in enumerate(saved):
+        img.created_at = base + timedelta(microseconds=idx)
+    # One executemany INSERT; the rows are returned as-is, so they don't need to be tracked by the session.
+    await session.execute(insert(ModelImage), [img.model_dump() for img in saved])
+    await session.commit()
+    return {"saved": saved}
+
+
+def _take_task_result(task_id: str) -> tuple[str, object]:
+    # WebSocket generations have no job row; nothing else reads the stored result once we have it.
+    state, result = _celery_snapshot(task_id)
+    if state in celery_states.READY_STATES:
+        celery_app.backend.forget(task_id)
+    return state, result
+
+
+async def _await_task_events(pubsub, task_id: str, on_progress) -> tuple[str, object]:
+    """
+    Forward a task's job events (see worker/worker/events.py) to `on_progress` until it finishes.
 
-        session.commit()
-        return {"saved": saved}
+    Events are pushed, so there is no polling; the final payload is read from the result backend once.
+    If nothing arrives for `_WS_EVENT_TIMEOUT_S` the result backend is checked directly, in case a
+    terminal event was missed.
+    """
+    while True:
+        msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=_WS_EVENT_TIMEOUT_S)
+        if msg is not None:
+            event = orjson.loads(msg["data"])
+            if event.get("status") == "running":
+                info = {"progress": event.get("progress"), "message": event.get("message")}
+                await on_progress(_progress_payload("PROGRESS", info))
+                continue
+        state, result = await asyncio.to_thread(_take_task_result, task_id)
+        if state in celery_states.READY_STATES:
+            return state, result
+
+
+def _progress_payload(state: str | None, info: object) -> dict:
+    return {"status": "processing", "state": state, **(info if isinstance(info, dict) else {})}
+
+
+async def _ws_send_json(websocket: WebSocket, payload: dict) -> None:
+    # orjson instead of `send_json`'s stdlib json; text (not binary) frames keep `JSON.parse(event.data)`
+    # clients working.
+    await websocket.send_text(orjson.dumps(payload).decode())
 
 
 @app.websocket("/ws/generate")
 async def ws_generate(websocket: WebSocket):
     await websocket.accept()
 
+    async def send(payload: dict) -> None:
+        await _ws_send_json(websocket, payload)
+
+    latest_progress: dict | None = None
+    flusher: asyncio.Task | None = None
+
+    async def flush_progress() -> None:
+        nonlocal latest_progress
+        while True:
+            await asyncio.sleep(_WS_PROGRESS_FLUSH_S)
+            if latest_progress is not None:
+                payload, latest_progress = latest_progress, None
+                await asyncio.wait_for(send(payload), timeout=_WS_SEND_TIMEOUT_S)
+
+    async def on_progress(payload: dict) -> None:
+        # Only overwrite the pending frame; the flusher owns the socket, so event intake never waits on the client.
+        nonlocal latest_progress
+        if flusher is not None and flusher.done():
+            flusher.result()
+        latest_progress = payload
+
     try:
         while True:
-            data = await websocket.receive_json()
+            data = orjson.loads(await websocket.receive_text())
 
             model_id = (data.get("model_id") or "").strip()
             prompt = (data.get("prompt") or "").strip()
@@ -906,58 +1210,51 @@ async def ws_generate(websocket: WebSocket):
             consent_confirmed = bool(data.get("consent_confirmed"))
 
             if not consent_confirmed:
-                await websocket.send_json({"status": "error", "message": "consent_confirmed must be true"})
+                await send({"status": "error", "message": "consent_confirmed must be true"})
                 continue
 
             if not model_id or not prompt:
-                await websocket.send_json({"status": "error", "message": "model_id and prompt required"})
+                await send({"status": "error", "message": "model_id and prompt required"})
                 continue
 
-            with Session(engine) as session:
-                m = session.get(Model, model_id)
+            async with AsyncSessionLocal() as session:
+                m = await session.get(Model, model_id)
                 if not m:
-                    await websocket.send_json({"status": "error", "message": "model not found"})
+                    await send({"status": "error", "message": "model not found"})
                     continue
 
-                q = select(ModelImage).where(ModelImage.model_id == model_id).order_by(ModelImage.created_at.asc())
-                all_images = list(session.exec(q))
-
-                if image_ids:
-                    selected = [img for img in all_images if img.id in set(image_ids)]
-                else:
-                    selected = all_images
+                selected = (await session.scalars(_model_images_query(model_id, image_ids))).all()
 
                 # Allow zero reference images (pure text-to-image).
 
                 image_paths = [str(STORAGE_DIR / img.rel_path) for img in selected]
 
-            task = celery_app.send_task(
-                "worker.tasks.generate_consistent_image",
-                args=[uuid.uuid4().hex, prompt, image_paths, None, None],
-            )
-            await websocket.send_json({"status": "queued", "task_id": task.id})
-
-            async_res = AsyncResult(task.id, app=celery_app)
-            last_state = None
-            while True:
-                async_res = AsyncResult(task.id, app=celery_app)
-                state = async_res.state
-                info = async_res.info if isinstance(async_res.info, dict) else {}
-
-                if state != last_state or state in {"PROGRESS"}:
-                    payload = {"status": "processing", "state": state, **info}
-                    await websocket.send_json(payload)
-                    last_state = state
-
-                if async_res.ready():
-                    if async_res.successful():
-                        result = async_res.get(timeout=1)
-                        await websocket.send_json({"status": "complete", "result": result})
-                    else:
-                        await websocket.send_json({"status": "error", "message": str(async_res.result)})
-                    break
-
-                await asyncio.sleep(1)
+            # Subscribe before enqueueing so no event can be published ahead of us.
+            job_id = uuid.uuid4().hex
+            pubsub = job_events.get_redis().pubsub()
+            await pubsub.subscribe(job_events.job_channel(job_id))
+            try:
+                task = celery_app.send_task(
+                    "worker.tasks.generate_consistent_image",
+                    args=[job_id, prompt, image_paths, None, None],
+                )
+                await send({"status": "queued", "task_id": task.id})
+                latest_progress = None
+                flusher = asyncio.create_task(flush_progress())
+                state, result = await _await_task_events(pubsub, task.id, on_progress)
+            finally:
+                if flusher is not None:
+                    flusher.cancel()
+                    flusher = None
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+            if state == celery_states.SUCCESS:
+                await send({"status": "complete", "result": result})
+            else:
+                await send({"status": "error", "message": str(result)})
 
     except WebSocketDisconnect:
         return
+    except asyncio.TimeoutError:
+        logger.warning("ws /generate client not reading; closing")
+        await websocket.close(code=1011)
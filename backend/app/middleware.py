@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+
+import orjson
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .errors import error_envelope
+
+logger = logging.getLogger("backend")
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Basic security headers (lightweight; for full CSP, prefer a reverse proxy like Caddy/Nginx).
+_SECURITY_HEADERS = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"referrer-policy", b"no-referrer"),
+    (b"cross-origin-resource-policy", b"same-site"),
+)
+
+
+# Media types worth compressing; images and other binaries are already compressed.
+_GZIP_MEDIA_PREFIXES = (b"application/json", b"text/")
+
+
+def _compressible(content_type: bytes) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(_GZIP_MEDIA_PREFIXES) and not content_type.startswith(b"text/event-stream")
+
+
+class _SelectiveGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message: Message) -> None:
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            content_type = next((v for k, v in message.get("headers", ()) if k.lower() == b"content-type"), b"")
+            # Reuses the base responder's pass-through path for already-encoded responses.
+            if not _compressible(content_type):
+                self.content_encoding_set = True
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    GZip JSON and text responses only. Requests under `exclude_paths` (e.g. the /storage mount) and
+    Server-Sent Events are never buffered through the compressor; images and other media pass through as-is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, exclude_paths: tuple[str, ...] = ()) -> None:
+        super().__init__(app, minimum_size=minimum_size)
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = b""
+        for key, value in scope["headers"]:
+            if key == b"accept" and b"text/event-stream" in value:
+                await self.app(scope, receive, send)
+                return
+            if key == b"accept-encoding":
+                accept_encoding = value
+        if b"gzip" not in accept_encoding or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+        responder = _SelectiveGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        await responder(scope, receive, send)
+
+
+class RequestIDMiddleware:
+    """
+    Assigns a request id (`request.state.request_id`), adds it and the security headers to the response,
+    and writes the access log line.
+
+    Plain ASGI rather than `@app.middleware("http")`: headers are patched on the response-start message,
+    so there is no extra task per request and no response wrapping.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = next((v.decode("latin-1") for k, v in scope["headers"] if k == REQUEST_ID_HEADER), None)
+        rid = rid or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = rid
+        start = time.monotonic()
+        status_code: int | None = None
+
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                present = {k.lower() for k, _ in headers}
+                headers.append((REQUEST_ID_HEADER, rid.encode("latin-1")))
+                headers.extend(h for h in _SECURITY_HEADERS if h[0] not in present)
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            client = scope.get("client")
+            logger.info(
+                "rid=%s ip=%s %s %s status=%s dur_ms=%.1f",
+                rid,
+                client[0] if client else None,
+                scope["method"],
+                scope["path"],
+                status_code,
+                (time.monotonic() - start) * 1000.0,
+            )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects multipart requests whose declared Content-Length exceeds `max_body_bytes` with a 413,
+    before any of the body is read (FastAPI parses form bodies before the endpoint runs).
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int) -> None:
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            content_type = b""
+            content_length = None
+            for k, v in scope["headers"]:
+                if k == b"content-type":
+                    content_type = v
+                elif k == b"content-length":
+                    content_length = v
+            if content_type.startswith(b"multipart/") and content_length and content_length.isdigit():
+                if int(content_length) > self.max_body_bytes:
+                    await self._reject(scope, send)
+                    return
+        await self.app(scope, receive, send)
+
+    async def _reject(self, scope: Scope, send: Send) -> None:
+        rid = scope.get("state", {}).get("request_id")
+        body = orjson.dumps(
+            error_envelope(
+                code="http_error",
+                message=f"Request body too large (>{self.max_body_bytes} bytes)",
+                request_id=rid,
+            )
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -13,12 +14,15 @@ class Model(SQLModel, table=True):
     tags_json: str = Field(default="[]")
     notes: Optional[str] = Field(default=None)
     archived_at: Optional[datetime] = Field(default=None, index=True)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
 class ModelImage(SQLModel, table=True):
+    # Serves `WHERE model_id = ? ORDER BY created_at` without a temp sort.
+    __table_args__ = (Index("ix_modelimage_model_created", "model_id", "created_at"),)
+
     id: str = Field(primary_key=True, index=True)
-    model_id: str = Field(index=True)
+    model_id: str  # indexed via ix_modelimage_model_created
     filename: str
     rel_path: str  # relative to STORAGE_DIR
     width: int
@@ -51,18 +55,27 @@ class GenerationJob(SQLModel, table=True):
     Status values (stringly typed for simplicity): queued | running | complete | error | cancelled
     """
 
+    # Serve the "latest jobs for a model" and "jobs by status" listings as index walks (either direction).
+    __table_args__ = (
+        Index("ix_generationjob_model_created", "model_id", "created_at"),
+        Index("ix_generationjob_status_created", "status", "created_at"),
+    )
+
     id: str = Field(primary_key=True, index=True)
-    model_id: str = Field(index=True)
+    model_id: str  # indexed via ix_generationjob_model_created
 
     prompt: str
     source: str = Field(default="api", index=True)  # studio | test | api
     prompt_template_id: Optional[str] = Field(default=None, index=True)
     params_json: str = Field(default="{}")
     image_ids_json: str = Field(default="[]")
+    # blake2b of (model, prompt, params, refs) for seeded runs; lets identical requests reuse a finished job.
+    # Cleared when the worker fell back to its mock output, so placeholders are never reused.
+    dedup_key: Optional[str] = Field(default=None, index=True)
 
     celery_task_id: Optional[str] = Field(default=None, index=True)
 
-    status: str = Field(default="queued", index=True)
+    status: str = Field(default="queued")  # indexed via ix_generationjob_status_created
     progress: Optional[int] = Field(default=None)
     message: Optional[str] = Field(default=None)
 
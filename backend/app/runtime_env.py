@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import time
 from dataclasses import dataclass
 
 import httpx
@@ -49,7 +51,28 @@ def _gpu_server_headers() -> dict[str, str]:
     return {"Authorization": f"Bearer {api_key}"}
 
 
-@dataclass(frozen=True)
+_HTTP: httpx.AsyncClient | None = None
+
+
+def _http_client() -> httpx.AsyncClient:
+    # One pooled client per process so repeated probes reuse keep-alive connections.
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=2.0, read=2.0, write=2.0, pool=2.0),
+            limits=httpx.Limits(max_keepalive_connections=10),
+        )
+    return _HTTP
+
+
+async def aclose() -> None:
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
+
+@dataclass(frozen=True, slots=True)
 class GpuServerStatus:
     url: str
     reachable: bool
@@ -61,8 +84,7 @@ async def resolve_gpu_server_status() -> GpuServerStatus:
     headers = _gpu_server_headers()
 
     async def _healthcheck(base_url: str) -> bool:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(connect=2.0, read=2.0, write=2.0, pool=2.0)) as client:
-            r = await client.get(f"{base_url}/health", headers=headers)
+        r = await _http_client().get(f"{base_url}/health", headers=headers)
         return r.status_code == 200
 
     if override:
@@ -75,14 +97,39 @@ async def resolve_gpu_server_status() -> GpuServerStatus:
     if not _auto_gpu_server_enabled():
         return GpuServerStatus(url="", reachable=False, reason="auto_gpu_server_disabled")
 
-    for candidate in _gpu_server_candidates():
+    async def _probe(candidate: str) -> str | None:
         try:
-            ok = await _healthcheck(candidate)
+            return candidate if await _healthcheck(candidate) else None
         except Exception:
-            ok = False
-        if ok:
-            return GpuServerStatus(url=candidate, reachable=True, reason="auto_discovered")
+            return None
+
+    # Probe all candidates at once so down hosts cost one timeout in total, not one each.
+    tasks = [asyncio.create_task(_probe(c)) for c in _gpu_server_candidates()]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            winner = await fut
+            if winner:
+                return GpuServerStatus(url=winner, reachable=True, reason="auto_discovered")
+    finally:
+        for t in tasks:
+            t.cancel()
 
     return GpuServerStatus(url="", reachable=False, reason="no_healthy_candidates")
 
 
+_STATUS_TTL_S = 5.0
+_status_cache: tuple[float, GpuServerStatus] | None = None
+_status_lock = asyncio.Lock()
+
+
+async def cached_gpu_server_status() -> GpuServerStatus:
+    """`resolve_gpu_server_status`, probed at most once per TTL; concurrent callers share one probe."""
+    global _status_cache
+    if _status_cache is not None and time.monotonic() - _status_cache[0] < _STATUS_TTL_S:
+        return _status_cache[1]
+    async with _status_lock:
+        if _status_cache is not None and time.monotonic() - _status_cache[0] < _STATUS_TTL_S:
+            return _status_cache[1]
+        status = await resolve_gpu_server_status()
+        _status_cache = (time.monotonic(), status)
+        return status
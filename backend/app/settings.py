@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from functools import cached_property, lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,11 +16,36 @@ class Settings(BaseSettings):
 
     redis_url: str = "redis://redis:6379/0"
     database_url: str = "sqlite:///./storage/app.db"
+    # Async driver URL for request handlers (e.g. "sqlite+aiosqlite:///./storage/app.db").
+    # Empty derives it from DATABASE_URL.
+    async_database_url: str = ""
     storage_dir: str = "./storage"
+    # Serve /storage from the API (dev). Disable when a reverse proxy serves STORAGE_DIR directly with sendfile.
+    serve_storage: bool = True
+    # How often the API runs `PRAGMA optimize` against SQLite (0 disables the periodic run).
+    sqlite_optimize_interval_s: int = 900
     # Comma-separated list of allowed origins (set "*" to allow all).
     # Dev-friendly default allows any origin (no cookies/credentials are enabled when using "*").
     # For production, set `CORS_ORIGINS` explicitly (e.g. "https://app.yourdomain.com").
     cors_origins: str = "*"
 
+    @cached_property
+    def cors_origins_list(self) -> list[str]:
+        return _split_csv(self.cors_origins)
+
+    @cached_property
+    def allowed_hosts_list(self) -> list[str]:
+        return _split_csv(self.allowed_hosts)
+
+
+def _split_csv(raw: str) -> list[str]:
+    return [p.strip() for p in (raw or "").split(",") if p.strip()]
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    # Parse the environment / .env once per process.
+    return Settings()
+
 
-settings = Settings()
+settings = get_settings()
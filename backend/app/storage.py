@@ -15,6 +15,8 @@ def ensure_dir(path: Path) -> None:
 def strip_exif_and_resize_to_square_1024(src_path: Path, dst_path: Path) -> tuple[int, int]:
     """Loads an image, removes EXIF by re-encoding, fixes orientation, and resizes to 1024x1024."""
     with Image.open(src_path) as im:
+        # JPEG only: let libjpeg decode at a reduced DCT scale (still >= 1024 on both sides) instead of full size.
+        im.draft("RGB", (1024, 1024))
         im = ImageOps.exif_transpose(im)
         im = im.convert("RGB")
         im = ImageOps.fit(im, (1024, 1024), method=Image.Resampling.LANCZOS)
@@ -23,10 +25,29 @@ def strip_exif_and_resize_to_square_1024(src_path: Path, dst_path: Path) -> tupl
         return im.size
 
 
-def save_upload_to_tmp(upload_bytes: bytes, tmp_dir: Path, suffix: str) -> Path:
+class UploadTooLargeError(ValueError):
+    pass
+
+
+def save_upload_to_tmp(upload: BinaryIO, tmp_dir: Path, suffix: str, max_bytes: int | None = None) -> Path:
+    """
+    Copies an upload stream to a tmp file in 1 MiB chunks (never holds the whole file in memory).
+
+    Raises UploadTooLargeError as soon as more than `max_bytes` have been read; the partial file is removed.
+    """
     ensure_dir(tmp_dir)
     tmp_path = tmp_dir / f"upload-{uuid.uuid4().hex}{suffix}"
-    tmp_path.write_bytes(upload_bytes)
+    try:
+        with tmp_path.open("wb") as out:
+            size = 0
+            while chunk := upload.read(1 << 20):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(f"upload exceeds {max_bytes} bytes")
+                out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     return tmp_path
 
 
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings are read at import time; point the app at a throwaway SQLite database and storage dir first.
+_TMP = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/app.db"
+os.environ["STORAGE_DIR"] = _TMP
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+from app import main  # noqa: E402
+from app.db import init_db  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+class _SentTask:
+    def __init__(self, task_id):
+        self.id = task_id
+
+
+@pytest.fixture
+def client(monkeypatch):
+    init_db()
+    sent = []
+
+    def send_task(name, args=None, task_id=None, **kwargs):
+        sent.append(task_id)
+        return _SentTask(task_id)
+
+    monkeypatch.setattr(main.celery_app, "send_task", send_task)
+    # Not entered as a context manager: startup hooks (Redis lease, job-event mirror) stay off.
+    c = TestClient(main.app)
+    c.sent = sent
+    return c
+
+
+def _generate(client, prompt, params=None):
+    body = {"prompt": prompt, "consent_confirmed": True}
+    if params is not None:
+        body["params"] = params
+    resp = client.post("/v1/generations", json=body)
+    assert resp.status_code == 202
+    return resp.json()
+
+
+def test_same_seed_returns_existing_active_job(client):
+    first = _generate(client, "dedup same seed", {"seed": 7})
+    second = _generate(client, "dedup same seed", {"seed": 7})
+    assert second["job_id"] == first["job_id"]
+    assert second["deduplicated"] is True
+    assert len(client.sent) == 1
+
+
+def test_different_seed_creates_new_job(client):
+    first = _generate(client, "dedup other seed", {"seed": 7})
+    second = _generate(client, "dedup other seed", {"seed": 8})
+    assert second["job_id"] != first["job_id"]
+    assert "deduplicated" not in second
+    assert len(client.sent) == 2
+
+
+def test_unseeded_requests_never_dedupe(client):
+    first = _generate(client, "dedup no seed", {"steps": 20})
+    second = _generate(client, "dedup no seed", {"steps": 20})
+    third = _generate(client, "dedup no seed")
+    assert len({first["job_id"], second["job_id"], third["job_id"]}) == 3
+    assert len(client.sent) == 3
+
+
+def test_dedup_key_ignores_param_order():
+    a = main._dedup_key("m", "p", {"seed": 1, "width": 512}, ["i1", "i2"])
+    b = main._dedup_key("m", "p", {"width": 512, "seed": 1}, ["i1", "i2"])
+    assert a is not None and a == b
+    assert main._dedup_key("m", "p", {"width": 512}, ["i1", "i2"]) is None
+
+
+def test_mock_fallback_result_is_not_reused():
+    job = main.GenerationJob(id="j", model_id="m", prompt="p", dedup_key="k", status="running")
+    main._apply_job_event(job, {"status": "complete", "output_url": "/storage/outputs/x.jpg", "mock": True})
+    assert job.status == "complete"
+    assert job.dedup_key is None
@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import asyncio
 import io
+import json
 import os
 import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated
 
-from fastapi import FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, UploadFile
 from fastapi.responses import Response
-from PIL import Image
+from PIL import Image, ImageOps
 
 # Reduce CUDA allocator fragmentation by default (does not override explicit user setting).
 os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
@@ -44,6 +47,28 @@ def _max_image_bytes() -> int:
         return 8388608
 
 
+def _upload_size(f: UploadFile) -> int:
+    if f.size is not None:
+        return f.size
+    f.file.seek(0, os.SEEK_END)
+    size = f.file.tell()
+    f.file.seek(0)
+    return size
+
+
+def _open_upload_image(f: UploadFile, max_bytes: int) -> Image.Image:
+    # The multipart parser has already spooled the part to a temp file (on disk past 1 MiB);
+    # decode from that handle instead of copying the whole upload into a bytes object.
+    if _upload_size(f) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image too large (>{max_bytes} bytes): {f.filename}")
+    try:
+        f.file.seek(0)
+        with Image.open(f.file) as im:
+            return im.convert("RGB")
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {f.filename}")
+
+
 _PIPE = None
 _PIPE_DEVICE = None
 _MODEL_ID = "black-forest-labs/FLUX.2-dev"
@@ -56,6 +81,14 @@ def _max_concurrency() -> int:
         return 1
 
 _INFER_SEMAPHORE = asyncio.Semaphore(_max_concurrency())
+# Pipeline calls run on their own threads (one per semaphore slot) so long inferences never tie up the
+# default executor used for model init and JPEG encoding.
+_INFER_EXECUTOR = ThreadPoolExecutor(max_workers=_max_concurrency(), thread_name_prefix="gpu-infer")
+
+
+async def _run_inference(fn):
+    async with _INFER_SEMAPHORE:
+        return await asyncio.get_running_loop().run_in_executor(_INFER_EXECUTOR, fn)
 
 
 def _cpu_offload_mode() -> str:
@@ -77,6 +110,65 @@ def _cpu_offload_mode() -> str:
     return v
 
 
+def _quantize_mode() -> str:
+    """
+    Optional weight-only quantization of the FLUX transformer (requires `torchao`).
+
+    Values:
+    - "" / "0": disabled (default; bf16/fp16 weights)
+    - "fp8": float8 weight-only (Ada/Hopper)
+    - "int8": int8 weight-only
+    """
+    v = (os.environ.get("GPU_SERVER_QUANTIZE") or "").strip().lower()
+    if v in {"", "0", "false", "no", "off"}:
+        return ""
+    return v
+
+
+def _quantize_transformer(pipe) -> None:
+    mode = _quantize_mode()
+    if not mode:
+        return
+    try:
+        from torchao.quantization import float8_weight_only, int8_weight_only, quantize_
+    except Exception as e:
+        raise RuntimeError("GPU_SERVER_QUANTIZE requires torchao (pip install torchao)") from e
+    configs = {"fp8": float8_weight_only, "int8": int8_weight_only}
+    if mode not in configs:
+        raise RuntimeError(f"Unsupported GPU_SERVER_QUANTIZE={mode!r} (expected fp8 or int8)")
+    quantize_(pipe.transformer, configs[mode]())
+    logger.info("quantized transformer weights mode=%s", mode)
+
+
+def _torch_compile_enabled() -> bool:
+    return (os.environ.get("GPU_SERVER_TORCH_COMPILE") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _tune_pipe(pipe, torch) -> None:
+    """
+    Speed knobs applied once at init.
+
+    `torch.compile` is opt-in (GPU_SERVER_TORCH_COMPILE=1): the first request pays the compile cost, and it is
+    skipped under CPU offload, where accelerate's device-moving hooks break graph capture.
+    """
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+    # Request shapes repeat (clamped, multiple-of-8 sizes), so cuDNN's autotuned algorithms get reused.
+    torch.backends.cudnn.benchmark = True
+    if hasattr(pipe, "disable_attention_slicing"):
+        pipe.disable_attention_slicing()
+
+    if not _torch_compile_enabled():
+        return
+    if _cpu_offload_mode():
+        logger.warning("GPU_SERVER_TORCH_COMPILE ignored: requires DIFFUSERS_CPU_OFFLOAD=0")
+        return
+    pipe.transformer = torch.compile(pipe.transformer, mode="reduce-overhead", fullgraph=False)
+    pipe.vae.decode = torch.compile(pipe.vae.decode)
+    logger.info("torch.compile enabled for transformer and vae.decode")
+
+
 def _init_pipe_sync():
     global _PIPE, _PIPE_DEVICE
     if _PIPE is not None:
@@ -133,6 +225,9 @@ def _init_pipe_sync():
             ) from e
         raise
 
+    # Quantize before placement so the smaller weights are what gets moved/offloaded.
+    _quantize_transformer(pipe)
+
     # Optional VRAM-saving modes. These trade speed for fitting on smaller GPUs.
     offload = _cpu_offload_mode()
     if offload == "sequential":
@@ -145,6 +240,7 @@ def _init_pipe_sync():
         pipe = pipe.to("cuda")
         _PIPE_DEVICE = "cuda"
 
+    _tune_pipe(pipe, torch)
     _PIPE = pipe
     logger.info("pipeline ready device=%s", _PIPE_DEVICE)
     return _PIPE
@@ -178,7 +274,46 @@ async def _get_pipe_async():
             raise
 
 
-@app.get("/health")
+def _encode_jpeg(im: Image.Image) -> bytes:
+    # Single-pass Huffman (no `optimize`): ~2x faster encode for a few % larger output.
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def _warmup_enabled() -> bool:
+    return (os.environ.get("GPU_SERVER_WARMUP") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+async def _warmup() -> None:
+    """Load the pipeline and run one short 1024x1024 pass (cuDNN autotune / compile) before the first request."""
+    try:
+        pipe = await _get_pipe_async()
+        import torch
+
+        def _run():
+            with torch.inference_mode():
+                pipe(prompt="warmup", num_inference_steps=1, width=1024, height=1024)
+
+        await _run_inference(_run)
+        logger.info("warmup done")
+    except Exception as e:
+        # Requests retry the lazy init, so a failed warmup only costs latency.
+        logger.warning("warmup failed: %s", e)
+
+
+_WARMUP_TASK: asyncio.Task | None = None
+
+
+@app.on_event("startup")
+async def _start_warmup() -> None:
+    # Run in the background so /health answers while weights load.
+    global _WARMUP_TASK
+    if _warmup_enabled():
+        _WARMUP_TASK = asyncio.create_task(_warmup())
+
+
+@app.api_route("/health", methods=["GET", "HEAD"])
 def health() -> dict:
     # Keep this lightweight (do not initialize the model here).
     try:
@@ -195,6 +330,67 @@ def health() -> dict:
         return {"ok": True}
 
 
+def _clean_prompt(prompt: str | None) -> str:
+    prompt = (prompt or "").strip()
+    if not prompt:
+        raise HTTPException(status_code=400, detail="prompt required")
+    if len(prompt) > 4000:
+        raise HTTPException(status_code=400, detail="prompt too long")
+    return prompt
+
+
+def _clamp_params(num_inference_steps, guidance_scale, width, height) -> tuple[int, float, int, int]:
+    # Clamp to keep the server stable.
+    num_inference_steps = max(1, min(int(num_inference_steps), 80))
+    guidance_scale = max(0.0, min(float(guidance_scale), 20.0))
+    width = max(256, min(int(width), 2048))
+    height = max(256, min(int(height), 2048))
+    # Many diffusion pipelines expect multiples of 8.
+    width -= width % 8
+    height -= height % 8
+    return num_inference_steps, guidance_scale, width, height
+
+
+def _load_refs(images: list[UploadFile], width: int, height: int) -> list[Image.Image]:
+    if len(images) > 10:
+        raise HTTPException(status_code=400, detail="Max 10 images")
+    max_bytes = _max_image_bytes()
+    pil_images: list[Image.Image] = []
+    for f in images:
+        im = _open_upload_image(f, max_bytes)
+        # Crop/resize on CPU to the output size so the pipeline never uploads full-resolution refs to the GPU.
+        if im.size != (width, height):
+            im = ImageOps.fit(im, (width, height), method=Image.Resampling.LANCZOS)
+        pil_images.append(im)
+    return pil_images
+
+
+def _call_pipe(pipe, kwargs: dict, pil_images: list[Image.Image]):
+    if pil_images:
+        # Flux2Pipeline APIs vary across versions; try a few common shapes.
+        try:
+            local_kwargs = dict(kwargs)
+            local_kwargs["image"] = pil_images if len(pil_images) > 1 else pil_images[0]
+            return pipe(**local_kwargs)
+        except TypeError:
+            local_kwargs = dict(kwargs)
+            local_kwargs["images"] = pil_images
+            return pipe(**local_kwargs)
+    return pipe(**kwargs)
+
+
+def _release_after_oom(e: Exception) -> None:
+    # Best-effort memory recovery after OOM.
+    try:
+        if "out of memory" in str(e).lower():
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
 @app.post("/generate")
 async def generate(
     prompt: str = Form(...),
@@ -216,35 +412,11 @@ async def generate(
     )
     _require_api_key(authorization=authorization, x_api_key=x_api_key)
 
-    prompt = (prompt or "").strip()
-    if not prompt:
-        raise HTTPException(status_code=400, detail="prompt required")
-    if len(prompt) > 4000:
-        raise HTTPException(status_code=400, detail="prompt too long")
-
-    if len(images) > 10:
-        raise HTTPException(status_code=400, detail="Max 10 images")
-
-    # Clamp to keep the server stable.
-    num_inference_steps = max(1, min(int(num_inference_steps), 80))
-    guidance_scale = max(0.0, min(float(guidance_scale), 20.0))
-    width = max(256, min(int(width), 2048))
-    height = max(256, min(int(height), 2048))
-    # Many diffusion pipelines expect multiples of 8.
-    width -= width % 8
-    height -= height % 8
-
-    max_bytes = _max_image_bytes()
-    pil_images: list[Image.Image] = []
-    for f in images:
-        raw = await f.read()
-        if len(raw) > max_bytes:
-            raise HTTPException(status_code=413, detail=f"Image too large (>{max_bytes} bytes): {f.filename}")
-        try:
-            im = Image.open(io.BytesIO(raw))
-            pil_images.append(im.convert("RGB"))
-        except Exception:
-            raise HTTPException(status_code=400, detail=f"Invalid image: {f.filename}")
+    prompt = _clean_prompt(prompt)
+    num_inference_steps, guidance_scale, width, height = _clamp_params(
+        num_inference_steps, guidance_scale, width, height
+    )
+    pil_images = await asyncio.to_thread(_load_refs, images, width, height)
 
     try:
         pipe = await _get_pipe_async()
@@ -277,43 +449,158 @@ async def generate(
             int(height),
             len(pil_images),
         )
-        async with _INFER_SEMAPHORE:
-            def _call_pipe():
-                with torch.inference_mode():
-                    if pil_images:
-                        # Flux2Pipeline APIs vary across versions; try a few common shapes.
-                        try:
-                            local_kwargs = dict(kwargs)
-                            local_kwargs["image"] = pil_images if len(pil_images) > 1 else pil_images[0]
-                            return pipe(**local_kwargs)
-                        except TypeError:
-                            local_kwargs = dict(kwargs)
-                            local_kwargs["images"] = pil_images
-                            return pipe(**local_kwargs)
-                    return pipe(**kwargs)
-
-            result = await asyncio.to_thread(_call_pipe)
+        def _run():
+            with torch.inference_mode():
+                return _call_pipe(pipe, kwargs, pil_images)
+
+        result = await _run_inference(_run)
 
         logger.info("rid=%s inference done; encoding jpeg", x_request_id)
-        out = result.images[0]
-        buf = io.BytesIO()
-        out.save(buf, format="JPEG", quality=92, optimize=True)
+        body = await asyncio.to_thread(_encode_jpeg, result.images[0])
         headers = {}
         if x_request_id:
             headers["x-request-id"] = x_request_id
-        return Response(content=buf.getvalue(), media_type="image/jpeg", headers=headers)
+        return Response(content=body, media_type="image/jpeg", headers=headers)
     except HTTPException:
         raise
     except Exception as e:
-        # Best-effort memory recovery after OOM.
+        _release_after_oom(e)
+        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+
+
+def _max_batch_items() -> int:
+    try:
+        return max(1, int(os.environ.get("GPU_SERVER_MAX_BATCH", "4")))
+    except Exception:
+        return 4
+
+
+def _zip_jpegs(images: dict[int, Image.Image], errors: dict[int, dict]) -> bytes:
+    buf = io.BytesIO()
+    # JPEGs don't deflate; store them as-is.
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for i, im in images.items():
+            zf.writestr(f"{i}.jpg", _encode_jpeg(im))
+        if errors:
+            zf.writestr("errors.json", json.dumps({str(i): e for i, e in errors.items()}))
+    return buf.getvalue()
+
+
+def _batch_item_params(form, i: int) -> tuple[str, int | None, tuple[int, float, int, int]]:
+    prompt = _clean_prompt(form.get(f"prompt_{i}"))
+    try:
+        params = json.loads(form.get(f"params_{i}") or "{}")
+        seed = params.get("seed")
+        seed = int(seed) if seed is not None else None
+        shape = _clamp_params(
+            params.get("num_inference_steps", 30),
+            params.get("guidance_scale", 4.0),
+            params.get("width", 1024),
+            params.get("height", 1024),
+        )
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail=f"Invalid params_{i}")
+    return prompt, seed, shape
+
+
+@app.post("/generate_batch")
+async def generate_batch(
+    request: Request,
+    authorization: Annotated[str | None, Header()] = None,
+    x_api_key: Annotated[str | None, Header()] = None,
+    x_request_id: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Several independent generations in one request (used by the worker's opt-in batching).
+
+    Form fields: `count`, then per item `i`: `prompt_{i}`, optional `params_{i}` (JSON object with the same knobs
+    as /generate) and files `images_{i}`. Text-only items sharing steps/guidance/size run as one batched pipeline
+    call; items with references run one by one. The response is a zip of `{i}.jpg` per item; items rejected as
+    invalid are skipped and listed in `errors.json` as `{"<i>": {"status_code": ..., "detail": ...}}` instead,
+    so one bad item doesn't fail the others.
+    """
+    _require_api_key(authorization=authorization, x_api_key=x_api_key)
+    form = await request.form()
+    try:
+        count = int(form.get("count") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="count must be an integer")
+    if not 1 <= count <= _max_batch_items():
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {_max_batch_items()}")
+    logger.info("rid=%s request /generate_batch count=%d", x_request_id, count)
+
+    items: dict[int, tuple[str, int | None, tuple[int, float, int, int], list[Image.Image]]] = {}
+    errors: dict[int, dict] = {}
+    for i in range(count):
         try:
-            if "out of memory" in str(e).lower():
-                import torch
+            prompt, seed, shape = _batch_item_params(form, i)
+            refs = await asyncio.to_thread(_load_refs, form.getlist(f"images_{i}"), shape[2], shape[3])
+        except HTTPException as e:
+            logger.info("rid=%s /generate_batch item=%d rejected: %s", x_request_id, i, e.detail)
+            errors[i] = {"status_code": e.status_code, "detail": e.detail}
+            continue
+        items[i] = (prompt, seed, shape, refs)
+    if not items:
+        return Response(content=_zip_jpegs({}, errors), media_type="application/zip")
 
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-        except Exception:
-            pass
-        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+    try:
+        pipe = await _get_pipe_async()
+    except Exception as e:
+        logger.exception("rid=%s model init failed: %s", x_request_id, e)
+        raise HTTPException(status_code=500, detail=f"Model init failed: {e}")
 
+    try:
+        import torch
 
+        def _generator(seed: int | None):
+            gen = torch.Generator(device="cuda")
+            if seed is None:
+                gen.seed()
+                return gen
+            return gen.manual_seed(seed)
+
+        def _run() -> dict[int, Image.Image]:
+            outputs: dict[int, Image.Image] = {}
+            text_only: dict[tuple[int, float, int, int], list[int]] = {}
+            with torch.inference_mode():
+                for i, (prompt, seed, shape, refs) in items.items():
+                    if refs:
+                        steps, guidance, width, height = shape
+                        kwargs = dict(
+                            prompt=prompt,
+                            num_inference_steps=steps,
+                            guidance_scale=guidance,
+                            width=width,
+                            height=height,
+                            generator=_generator(seed) if seed is not None else None,
+                        )
+                        outputs[i] = _call_pipe(pipe, kwargs, refs).images[0]
+                    else:
+                        text_only.setdefault(shape, []).append(i)
+                for (steps, guidance, width, height), idxs in text_only.items():
+                    result = pipe(
+                        prompt=[items[i][0] for i in idxs],
+                        num_inference_steps=steps,
+                        guidance_scale=guidance,
+                        width=width,
+                        height=height,
+                        # One generator per prompt keeps seeded items reproducible inside a batch.
+                        generator=[_generator(items[i][1]) for i in idxs],
+                    )
+                    for i, im in zip(idxs, result.images):
+                        outputs[i] = im
+            return outputs
+
+        outputs = await _run_inference(_run)
+
+        logger.info("rid=%s batch inference done; encoding %d jpegs", x_request_id, len(outputs))
+        body = await asyncio.to_thread(_zip_jpegs, outputs, errors)
+        headers = {}
+        if x_request_id:
+            headers["x-request-id"] = x_request_id
+        return Response(content=body, media_type="application/zip", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        _release_after_oom(e)
+        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import io
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+from . import http_client
+from .events import redis_client
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_PREFIX = "aia:gpu_batch:"
+_REPLY_PREFIX = "aia:gpu_batch_reply:"
+_REPLY_TTL_S = 3600
+
+
+class GpuBatchError(RuntimeError):
+    """A batched GPU call failed; `transient` is the lock holder's retry classification of the original error."""
+
+    def __init__(self, message: str, transient: bool) -> None:
+        super().__init__(message)
+        self.transient = transient
+
+
+def batch_size() -> int:
+    # 1 (default) disables batching: every task makes its own /generate call.
+    try:
+        return max(1, int(os.environ.get("GPU_BATCH_SIZE", "1")))
+    except Exception:
+        return 1
+
+
+def _batch_wait_s() -> float:
+    try:
+        return max(0.0, float(os.environ.get("GPU_BATCH_WAIT_MS", "50")) / 1000.0)
+    except Exception:
+        return 0.05
+
+
+def generate_batched(
+    *,
+    gpu_url: str,
+    headers: dict[str, str],
+    job_id: str,
+    prompt: str,
+    reference_images_paths: list[str],
+    params: dict[str, str],
+    timeout_s: float,
+    save_output: Callable[[bytes, str], str],
+) -> str:
+    """
+    Run one generation through the GPU server's /generate_batch, sharing the call with concurrent tasks.
+
+    Each task queues its request in Redis under the GPU server URL. Whichever task holds the batch lock waits
+    `GPU_BATCH_WAIT_MS` for others to join, sends up to `GPU_BATCH_SIZE` queued requests in one call, saves every
+    output via `save_output` and hands each task its result through a per-attempt reply list. The lock holder's own
+    request isn't necessarily in the batch it sends; it then keeps waiting for its reply like any other task.
+
+    `timeout_s` counts from when the request leaves the queue, so time spent behind other batches isn't charged to
+    it. On any exit the request is withdrawn from the queue if still there, and a reply that arrives after we gave up
+    lands in a key no retry will read.
+
+    Returns the output's /storage URL; raises RuntimeError with the GPU server's error otherwise.
+    """
+    r = redis_client()
+    queue_key = _QUEUE_PREFIX + gpu_url
+    lock_key = queue_key + ":lock"
+    token = uuid.uuid4().hex
+    reply_key = f"{_REPLY_PREFIX}{job_id}:{token}"
+    item = json.dumps(
+        {"prompt": prompt, "refs": reference_images_paths, "params": params, "reply": reply_key},
+        separators=(",", ":"),
+    )
+    r.rpush(queue_key, item)
+
+    deadline: float | None = None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            if r.set(lock_key, token, nx=True, px=int((timeout_s + 30) * 1000)):
+                try:
+                    time.sleep(_batch_wait_s())
+                    raw_items = r.lpop(queue_key, batch_size()) or []
+                    if raw_items:
+                        _send_batch(gpu_url, headers, [json.loads(x) for x in raw_items], timeout_s, save_output)
+                finally:
+                    if r.get(lock_key) == token.encode():
+                        r.delete(lock_key)
+            if deadline is None and r.lpos(queue_key, item) is None:
+                deadline = time.monotonic() + timeout_s
+            got = r.blpop([reply_key], timeout=1)
+            if got:
+                reply = json.loads(got[1])
+                if reply.get("error"):
+                    raise GpuBatchError(reply["error"], transient=bool(reply.get("transient")))
+                return reply["output_url"]
+        raise GpuBatchError(f"GPU batch timed out after {timeout_s:.0f}s", transient=True)
+    finally:
+        r.lrem(queue_key, 1, item)
+        r.delete(reply_key)
+
+
+def _send_batch(
+    gpu_url: str,
+    headers: dict[str, str],
+    items: list[dict],
+    timeout_s: float,
+    save_output: Callable[[bytes, str], str],
+) -> None:
+    # Per-item failures (unreadable reference, item rejected by the server) go to that item's task only;
+    # a failure of the call itself is shared by every item in it.
+    replies: list[dict | None] = [None] * len(items)
+    data: dict[str, str] = {}
+    files = []
+    sent: list[int] = []
+    for i, item in enumerate(items):
+        try:
+            refs = [Path(p).read_bytes() for p in item["refs"]]
+        except OSError as e:
+            replies[i] = {"error": f"Reference image unreadable: {e}"[:2000], "transient": False}
+            continue
+        n = len(sent)
+        data[f"prompt_{n}"] = item["prompt"]
+        data[f"params_{n}"] = json.dumps(item["params"])
+        for idx, ref in enumerate(refs):
+            files.append((f"images_{n}", (f"image{idx+1}.jpg", ref, "image/jpeg")))
+        sent.append(i)
+
+    if sent:
+        data["count"] = str(len(sent))
+        logger.info("POST %s/generate_batch (count=%d)", gpu_url, len(sent))
+        try:
+            resp = http_client.session().post(
+                f"{gpu_url}/generate_batch",
+                data=data,
+                files=files,
+                headers=headers,
+                timeout=(5, timeout_s),
+            )
+            if resp.status_code != 200:
+                raise http_client.GpuServerError(resp)
+            with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+                names = set(zf.namelist())
+                errors = json.loads(zf.read("errors.json")) if "errors.json" in names else {}
+                for n, i in enumerate(sent):
+                    if f"{n}.jpg" in names:
+                        replies[i] = {"output_url": save_output(zf.read(f"{n}.jpg"), "jpg")}
+                    else:
+                        err = errors.get(str(n)) or {"status_code": 500, "detail": "missing from batch response"}
+                        detail = f"GPU server error {err.get('status_code')}: {err.get('detail')}"
+                        replies[i] = {"error": detail[:2000], "transient": False}
+        except Exception as e:
+            logger.exception("GPU batch request error: %s", e)
+            shared = {"error": str(e)[:2000], "transient": http_client.is_transient(e)}
+            replies = [shared if reply is None else reply for reply in replies]
+
+    pipe = redis_client().pipeline()
+    for item, reply in zip(items, replies):
+        pipe.rpush(item["reply"], json.dumps(reply))
+        pipe.expire(item["reply"], _REPLY_TTL_S)
+    pipe.execute()
@@ -18,6 +18,22 @@ celery_app = Celery(
 celery_app.conf.update(
     task_track_started=True,
     task_send_sent_event=True,
+    # msgpack frames are smaller/faster than JSON; keep accepting JSON while older producers drain.
+    task_serializer="msgpack",
+    result_serializer="msgpack",
+    accept_content=["msgpack", "json"],
+    result_expires=3600,
+    # Must exceed the longest GPU call (GPU_SERVER_TIMEOUT_S) or unacked tasks get redelivered mid-run.
+    # Keep idle broker/result connections alive through NAT/conntrack timeouts instead of reconnecting on next use.
+    broker_transport_options={"visibility_timeout": 3600, "socket_keepalive": True},
+    redis_socket_keepalive=True,
+    # Must match the backend's prefix, or results are written/read under different keys.
+    result_backend_transport_options={"global_keyprefix": "aia:"},
+    # Image tasks are long: ack after completion and don't let one process hoard queued messages.
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    # Recycle pool processes periodically so PIL/numpy heap fragmentation can't grow RSS without bound.
+    worker_max_tasks_per_child=50,
 )
 
 celery_app.autodiscover_tasks(["worker"])
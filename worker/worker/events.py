@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+_CLIENT: redis.Redis | None = None
+
+
+def redis_client() -> redis.Redis:
+    # One connection pool per worker process (job events, GPU batch coordination).
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"))
+    return _CLIENT
+
+
+def job_channel(job_id: str) -> str:
+    # Must match backend/app/job_events.py.
+    return f"job:{job_id}"
+
+
+def publish_job_event(job_id: str | None, event: dict) -> None:
+    """Best-effort: push a job state change to API subscribers (SSE). Never fails the task."""
+    if not job_id:
+        return
+    try:
+        redis_client().publish(job_channel(job_id), json.dumps(event, separators=(",", ":")))
+    except Exception as e:
+        logger.warning("job=%s failed to publish event: %s", job_id, e)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_SESSION: requests.Session | None = None
+
+
+def session() -> requests.Session:
+    # One pooled session per worker process (created lazily, so each prefork child gets its own sockets).
+    # Keeps connections to the GPU server alive across health checks and generate calls.
+    global _SESSION
+    if _SESSION is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _SESSION = s
+    return _SESSION
+
+
+class GpuServerError(RuntimeError):
+    """Non-200 from the GPU server; keeps the status and any Retry-After (seconds) for retry decisions."""
+
+    def __init__(self, r: requests.Response) -> None:
+        super().__init__(f"GPU server error {r.status_code}: {(r.text or '')[:2000]}")
+        self.status_code = r.status_code
+        retry_after = (r.headers.get("retry-after") or "").strip()
+        self.retry_after = float(retry_after) if retry_after.isdigit() else None
+
+
+_TRANSIENT_STATUSES = frozenset({502, 503, 504})
+_TRANSIENT_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def is_transient(e: BaseException) -> bool:
+    """Whether the same request may succeed if retried: gateway/overload statuses, connection failures, timeouts."""
+    if isinstance(e, _TRANSIENT_EXCEPTIONS):
+        return True
+    status_code = getattr(e, "status_code", None)
+    if status_code is not None:
+        return status_code in _TRANSIENT_STATUSES
+    # Errors relayed from another process (batched calls) carry the classification made where they happened.
+    return bool(getattr(e, "transient", False))
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 
-import requests
+from . import http_client
 
 
 def _truthy(v: str | None) -> bool:
@@ -53,7 +56,7 @@ def _gpu_server_headers() -> dict[str, str]:
     return {"Authorization": f"Bearer {api_key}"}
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class GpuServerResolution:
     url: str  # empty means "no GPU server"
     reason: str
@@ -61,7 +64,11 @@ class GpuServerResolution:
 
 def _healthcheck(url: str, headers: dict[str, str]) -> tuple[bool, str | None]:
     try:
-        r = requests.get(f"{url}/health", headers=headers, timeout=(2, 2))
+        # HEAD skips the JSON body; older GPU servers only route GET, so fall back on 405.
+        session = http_client.session()
+        r = session.head(f"{url}/health", headers=headers, timeout=(2, 1), allow_redirects=False)
+        if r.status_code == 405:
+            r = session.get(f"{url}/health", headers=headers, timeout=(2, 1))
         if r.status_code != 200:
             return False, f"health {r.status_code}: {(r.text or '')[:2000]}"
         return True, None
@@ -86,11 +93,41 @@ def resolve_gpu_server_url() -> GpuServerResolution:
         return GpuServerResolution(url="", reason="auto_gpu_server_disabled")
 
     headers = _gpu_server_headers()
-    for candidate in _gpu_server_candidates():
-        ok, _ = _healthcheck(candidate, headers=headers)
-        if ok:
-            return GpuServerResolution(url=candidate, reason="auto_discovered")
+    candidates = _gpu_server_candidates()
+    if not candidates:
+        return GpuServerResolution(url="", reason="no_healthy_candidates")
+
+    # Probe all candidates at once so dead hosts cost one timeout in total, not one each.
+    ex = ThreadPoolExecutor(max_workers=len(candidates))
+    try:
+        futs = {ex.submit(_healthcheck, c, headers): c for c in candidates}
+        for fut in as_completed(futs):
+            ok, _ = fut.result()
+            if ok:
+                return GpuServerResolution(url=futs[fut], reason="auto_discovered")
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
 
     return GpuServerResolution(url="", reason="no_healthy_candidates")
 
 
+_RESOLVE_TTL_S = 15.0
+_resolve_cache: tuple[float, GpuServerResolution] | None = None
+_resolve_lock = threading.Lock()
+
+
+def resolve_gpu_server_url_cached() -> GpuServerResolution:
+    """`resolve_gpu_server_url`, memoized per process for `_RESOLVE_TTL_S` so a burst of jobs probes once."""
+    global _resolve_cache
+    with _resolve_lock:
+        now = time.monotonic()
+        if _resolve_cache is None or now - _resolve_cache[0] >= _RESOLVE_TTL_S:
+            _resolve_cache = (now, resolve_gpu_server_url())
+        return _resolve_cache[1]
+
+
+def invalidate_gpu_server_url() -> None:
+    # Called after a failed GPU request so the next job re-probes instead of trusting the cached URL.
+    global _resolve_cache
+    with _resolve_lock:
+        _resolve_cache = None
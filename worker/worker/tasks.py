@@ -1,36 +1,82 @@
 from __future__ import annotations
 
-import io
 import os
+import queue
+import random
+import threading
 import time
 import textwrap
 import uuid
 import logging
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
 from pathlib import Path
+from typing import BinaryIO, Iterator
 
-from celery import shared_task
-from PIL import Image, ImageDraw, ImageFont
+from celery import Task, shared_task
+from celery.signals import worker_init
+import PIL
+from PIL import Image, ImageDraw, ImageFont, features
 import requests
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 
-from .runtime_env import resolve_gpu_server_url
+from . import batching, http_client
+from .events import publish_job_event
+from .runtime_env import invalidate_gpu_server_url, resolve_gpu_server_url_cached
 
 logger = logging.getLogger(__name__)
 
+
+@worker_init.connect
+def _log_image_stack(**_kwargs) -> None:
+    # The mock path is Pillow-bound; make it visible whether the JPEG codec is the SIMD libjpeg-turbo build.
+    logger.info(
+        "Pillow %s libjpeg_turbo=%s",
+        PIL.__version__,
+        features.version_feature("libjpeg_turbo") if features.check_feature("libjpeg_turbo") else "no",
+    )
+
+
 def _storage_dir() -> Path:
-    return Path(os.environ.get("STORAGE_DIR", "./storage")).resolve()
+    return _resolved_storage_dir(os.environ.get("STORAGE_DIR", "./storage"))
 
 
 def _outputs_dir() -> Path:
-    p = _storage_dir() / "outputs"
+    return _ensured_outputs_dir(_storage_dir())
+
+
+# Keyed on the configured value, so a changed STORAGE_DIR is still picked up; each resolve/mkdir runs once.
+@lru_cache(maxsize=4)
+def _resolved_storage_dir(raw: str) -> Path:
+    return Path(raw).resolve()
+
+
+@lru_cache(maxsize=4)
+def _ensured_outputs_dir(storage_dir: Path) -> Path:
+    p = storage_dir / "outputs"
     p.mkdir(parents=True, exist_ok=True)
     return p
 
 
-def _load_ref(path: str) -> Image.Image:
+def _load_ref(path: str, size: int = 1024) -> Image.Image:
     im = Image.open(path)
+    # JPEG only (no-op otherwise): let libjpeg decode at a reduced DCT scale, no smaller than `size`.
+    im.draft("RGB", (size, size))
     return im.convert("RGB")
 
 
+def _multipart_body(data: dict[str, str], paths: list[str], stack: ExitStack) -> MultipartEncoder:
+    # Streams the reference files into the request body instead of reading them into memory first.
+    fields: list = list(data.items())
+    for idx, p in enumerate(paths):
+        try:
+            fh = stack.enter_context(open(p, "rb"))
+        except Exception as e:
+            raise RuntimeError(f"Failed to read reference image: {p} ({e})")
+        fields.append(("images", (f"image{idx+1}.jpg", fh, "image/jpeg")))
+    return MultipartEncoder(fields=fields)
+
+
 def _make_grid(images: list[Image.Image], tile: int = 512, cols: int = 3) -> Image.Image:
     if not images:
         return Image.new("RGB", (tile, tile), (30, 30, 30))
@@ -43,27 +89,31 @@ def _make_grid(images: list[Image.Image], tile: int = 512, cols: int = 3) -> Ima
     for i, im in enumerate(images):
         r = i // cols
         c = i % cols
-        thumb = im.copy()
-        thumb = thumb.resize((tile, tile))
-        canvas.paste(thumb, (c * tile, r * tile))
+        # resize() already returns a new image; bilinear is plenty for a preview grid.
+        canvas.paste(im.resize((tile, tile), Image.Resampling.BILINEAR), (c * tile, r * tile))
 
     return canvas
 
 
+@lru_cache(maxsize=4)
+def _font(size: int) -> ImageFont.ImageFont:
+    # Parsed once per worker process; falls back to PIL's built-in bitmap font.
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except Exception:
+        return ImageFont.load_default()
+
+
 def _draw_overlay(base: Image.Image, prompt: str, headline: str = "Mock output") -> Image.Image:
     im = base.copy()
-    draw = ImageDraw.Draw(im)
+    # RGBA drawing mode blends fills into the RGB image directly (no separate overlay image to composite).
+    draw = ImageDraw.Draw(im, "RGBA")
 
     # Semi-transparent bar
     bar_h = 180
-    overlay = Image.new("RGBA", (im.width, bar_h), (0, 0, 0, 170))
-    im.paste(overlay, (0, im.height - bar_h), overlay)
+    draw.rectangle((0, im.height - bar_h, im.width, im.height), fill=(0, 0, 0, 170))
 
-    # Font fallback
-    try:
-        font = ImageFont.truetype("DejaVuSans.ttf", 26)
-    except Exception:
-        font = ImageFont.load_default()
+    font = _font(26)
 
     text = f"{headline}\n" + "\n".join(textwrap.wrap(prompt, width=80)[:4])
     draw.text((18, im.height - bar_h + 18), text, fill=(255, 255, 255), font=font)
@@ -71,8 +121,8 @@ def _draw_overlay(base: Image.Image, prompt: str, headline: str = "Mock output")
 
 
 def _gpu_server_url() -> str:
-    # Prefer explicit override, but auto-discover when unset.
-    return resolve_gpu_server_url().url
+    # Prefer explicit override, but auto-discover when unset (cached briefly; see runtime_env).
+    return resolve_gpu_server_url_cached().url
 
 
 def _gpu_server_api_key() -> str:
@@ -96,6 +146,14 @@ def _gpu_timeout_s() -> float:
         return 600.0
 
 
+def _gpu_retry_budget_s() -> float:
+    # Wall-clock budget for retries after the first failed GPU request.
+    try:
+        return float(os.environ.get("GPU_RETRY_BUDGET_S", "60"))
+    except Exception:
+        return 60.0
+
+
 def _content_ext(content_type: str | None) -> str:
     ct = (content_type or "").lower()
     if "png" in ct:
@@ -105,17 +163,119 @@ def _content_ext(content_type: str | None) -> str:
     return "jpg"
 
 
-def _gpu_healthcheck(url: str, headers: dict[str, str]) -> tuple[bool, str | None]:
+def _fsync_outputs() -> bool:
+    return (os.environ.get("WORKER_FSYNC") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+@contextmanager
+def _output_file(ext: str) -> Iterator[tuple[BinaryIO, str]]:
+    """
+    Open a new `outputs/gen-<uuid>.<ext>` for writing and yield it with its /storage URL.
+
+    The data goes to a `.part` sibling that is renamed into place once complete, so the backend never serves a
+    partially written file (e.g. if the worker is killed mid-write).
+    """
+    out_path = _outputs_dir() / f"gen-{uuid.uuid4().hex}.{ext}"
+    tmp_path = out_path.with_name(out_path.name + ".part")
     try:
-        r = requests.get(f"{url}/health", headers=headers, timeout=(2, 2))
-        if r.status_code != 200:
-            return False, f"health {r.status_code}: {(r.text or '')[:2000]}"
-        return True, None
-    except Exception as e:
-        return False, str(e)
+        with open(tmp_path, "wb") as f:
+            # Backend serves /storage/**
+            yield f, f"/storage/outputs/{out_path.name}"
+            if _fsync_outputs():
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _save_output(content: bytes, ext: str) -> str:
+    with _output_file(ext) as (f, rel_url):
+        f.write(content)
+    return rel_url
 
 
-@shared_task(bind=True, name="worker.tasks.generate_consistent_image")
+def _stream_output(r: requests.Response, ext: str) -> str:
+    """
+    Copy the body to disk chunk by chunk instead of holding the whole image in memory.
+
+    This thread receives while a writer thread drains a small bounded queue to the file, so network and disk
+    time overlap instead of adding up.
+    """
+    with _output_file(ext) as (f, rel_url):
+        chunks: queue.Queue[bytes | None] = queue.Queue(maxsize=4)
+        errors: list[BaseException] = []
+
+        def _writer() -> None:
+            try:
+                while (chunk := chunks.get()) is not None:
+                    f.write(chunk)
+            except BaseException as e:
+                errors.append(e)
+                # Keep draining so the receiving side never blocks on a full queue.
+                while chunks.get() is not None:
+                    pass
+
+        writer = threading.Thread(target=_writer, name="output-writer", daemon=True)
+        writer.start()
+        try:
+            for chunk in r.iter_content(1 << 20):
+                chunks.put(chunk)
+        finally:
+            chunks.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+    return rel_url
+
+
+_UNREACHABLE_MARKERS = (
+    "failed to establish a new connection",
+    "connection refused",
+    "name or service not known",
+    "temporary failure in name resolution",
+)
+
+
+def _gpu_unreachable(e: Exception) -> bool:
+    # Nothing reached the server (refused / DNS), as opposed to a server-side error worth retrying.
+    # Batched calls surface errors as plain strings, hence the message check.
+    msg = str(e).lower()
+    return any(m in msg for m in _UNREACHABLE_MARKERS)
+
+
+def _report(task: Task, job_id: str, progress: int, message: str) -> None:
+    task.update_state(state="PROGRESS", meta={"progress": progress, "message": message})
+    publish_job_event(job_id, {"status": "running", "progress": progress, "message": message})
+
+
+def _task_job_id(args, kwargs) -> str | None:
+    return args[0] if args else kwargs.get("job_id")
+
+
+class _JobEventsTask(Task):
+    # Event fields mirror the API's job columns; the backend applies them to the GenerationJob row as-is.
+    def before_start(self, task_id, args, kwargs):
+        publish_job_event(_task_job_id(args, kwargs), {"status": "running", "message": "started"})
+
+    # Celery calls these after the result is stored, so subscribers that re-read the result see the final state.
+    def on_success(self, retval, task_id, args, kwargs):
+        event = {"status": "complete", "progress": 100, "message": "done"}
+        if isinstance(retval, dict) and retval.get("output_url"):
+            event["output_url"] = str(retval["output_url"])
+        if isinstance(retval, dict) and retval.get("mock"):
+            event["mock"] = True
+        publish_job_event(_task_job_id(args, kwargs), event)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        publish_job_event(
+            _task_job_id(args, kwargs),
+            {"status": "error", "error_code": "celery_failed", "error_message": str(exc)[:2000]},
+        )
+
+
+@shared_task(bind=True, base=_JobEventsTask, name="worker.tasks.generate_consistent_image")
 def generate_consistent_image(
     self,
     job_id: str,
@@ -132,40 +292,17 @@ def generate_consistent_image(
     """
 
     logger.info("rid=%s job=%s starting (refs=%d)", request_id, job_id, len(reference_images_paths))
-    self.update_state(state="PROGRESS", meta={"progress": 5, "message": "loading references"})
-    refs = [_load_ref(p) for p in reference_images_paths]
-
+    # No /health round-trip here: the first POST attempt doubles as the availability check (see below).
     gpu_url = _gpu_server_url()
     gpu_err: str | None = None
     headers = _request_headers(request_id=request_id)
     if gpu_url:
-
-        self.update_state(state="PROGRESS", meta={"progress": 25, "message": f"checking GPU server: {gpu_url}/health"})
-        ok, err = _gpu_healthcheck(gpu_url, headers=headers)
-        if not ok:
-            gpu_err = err or "unreachable"
-            logger.warning("rid=%s job=%s GPU server unavailable (%s); falling back to mock", request_id, job_id, gpu_err)
-            self.update_state(
-                state="PROGRESS",
-                meta={"progress": 30, "message": f"GPU server unavailable ({gpu_err}); using mock"},
-            )
-            gpu_url = ""
-        else:
-            logger.info("rid=%s job=%s GPU server healthy: %s", request_id, job_id, gpu_url)
-            self.update_state(state="PROGRESS", meta={"progress": 35, "message": "calling GPU server"})
+        _report(self, job_id, 35, "calling GPU server")
 
     if gpu_url:
         timeout_s = _gpu_timeout_s()
 
-        # Build multipart payload: prompt + images[]
-        files = []
-        for idx, p in enumerate(reference_images_paths):
-            try:
-                raw = Path(p).read_bytes()
-            except Exception as e:
-                raise RuntimeError(f"Failed to read reference image: {p} ({e})")
-            files.append(("images", (f"image{idx+1}.jpg", raw, "image/jpeg")))
-
+        # Multipart payload: prompt + tuning knobs + images[] (the files are streamed per attempt, see below)
         data: dict[str, str] = {"prompt": prompt}
         if isinstance(params, dict):
             # Optional tuning knobs passed through from API/UI.
@@ -176,65 +313,98 @@ def generate_consistent_image(
                 data[k] = str(v)
 
         last_err: Exception | None = None
+        retry_deadline: float | None = None
+        next_sleep = 0.0
         for attempt in range(1, 4):
             try:
                 if attempt > 1:
-                    self.update_state(
-                        state="PROGRESS",
-                        meta={"progress": 40, "message": f"retrying GPU request ({attempt}/3)"},
+                    _report(self, job_id, 40, f"retrying GPU request ({attempt}/3)")
+                    time.sleep(next_sleep)
+
+                if batching.batch_size() > 1:
+                    logger.info(
+                        "rid=%s job=%s queued for %s/generate_batch (attempt=%d)", request_id, job_id, gpu_url, attempt
+                    )
+                    rel_url = batching.generate_batched(
+                        gpu_url=gpu_url,
+                        headers=headers,
+                        job_id=job_id,
+                        prompt=prompt,
+                        reference_images_paths=reference_images_paths,
+                        params={k: v for k, v in data.items() if k != "prompt"},
+                        timeout_s=timeout_s,
+                        save_output=_save_output,
                     )
-                    time.sleep(2 * (attempt - 1))
-
-                logger.info("rid=%s job=%s POST %s/generate (attempt=%d timeout_s=%.1f)", request_id, job_id, gpu_url, attempt, timeout_s)
-                r = requests.post(
-                    f"{gpu_url}/generate",
-                    data=data,
-                    files=files,
-                    headers=headers,
-                    timeout=(5, timeout_s),
-                )
-                if r.status_code != 200:
-                    body = (r.text or "")[:2000]
-                    raise RuntimeError(f"GPU server error {r.status_code}: {body}")
-
-                self.update_state(state="PROGRESS", meta={"progress": 80, "message": "saving output"})
-
-                ext = _content_ext(r.headers.get("content-type"))
-                out_id = uuid.uuid4().hex
-                out_path = _outputs_dir() / f"gen-{out_id}.{ext}"
-                out_path.write_bytes(r.content)
-
-                self.update_state(state="PROGRESS", meta={"progress": 100, "message": "done"})
-
-                rel_url = f"/storage/outputs/{out_path.name}"
+                else:
+                    logger.info("rid=%s job=%s POST %s/generate (attempt=%d timeout_s=%.1f)", request_id, job_id, gpu_url, attempt, timeout_s)
+                    with ExitStack() as stack:
+                        payload = _multipart_body(data, reference_images_paths, stack)
+                        r = http_client.session().post(
+                            f"{gpu_url}/generate",
+                            data=payload,
+                            headers={**headers, "Content-Type": payload.content_type},
+                            timeout=(5, timeout_s),
+                            stream=True,
+                        )
+                    with r:
+                        if r.status_code != 200:
+                            raise http_client.GpuServerError(r)
+
+                        _report(self, job_id, 80, "saving output")
+                        rel_url = _stream_output(r, _content_ext(r.headers.get("content-type")))
+
+                _report(self, job_id, 100, "done")
+
                 logger.info("rid=%s job=%s complete (output=%s)", request_id, job_id, rel_url)
                 return {"job_id": job_id, "output_url": rel_url, "reference_count": len(reference_images_paths)}
             except Exception as e:
                 last_err = e
                 logger.exception("rid=%s job=%s GPU request error (attempt=%d): %s", request_id, job_id, attempt, e)
-                # Retry only on transient-ish errors.
-                msg = str(e).lower()
-                if "timed out" in msg or "connection" in msg or "503" in msg or "502" in msg or "504" in msg:
+                if attempt == 1 and _gpu_unreachable(e):
+                    gpu_err = str(e)[:500]
+                    invalidate_gpu_server_url()
+                    logger.warning(
+                        "rid=%s job=%s GPU server unavailable (%s); falling back to mock", request_id, job_id, gpu_err
+                    )
+                    _report(self, job_id, 35, f"GPU server unavailable ({gpu_err}); using mock")
+                    gpu_url = ""
+                    break
+                # Retry only errors where resending the same request can succeed (never on 4xx / bad input).
+                if http_client.is_transient(e):
+                    invalidate_gpu_server_url()
+                    # Jittered exponential backoff (or the server's Retry-After) so workers don't retry in lockstep,
+                    # bounded by a retry budget that starts at the first failure.
+                    next_sleep = getattr(e, "retry_after", None) or random.uniform(0.1, min(4.0, 0.5 * 2 ** attempt))
+                    if retry_deadline is None:
+                        retry_deadline = time.monotonic() + _gpu_retry_budget_s()
+                    if time.monotonic() + next_sleep > retry_deadline:
+                        break
                     continue
                 raise
 
-        raise RuntimeError(f"GPU request failed after retries: {last_err}")
+        if gpu_url:
+            raise RuntimeError(f"GPU request failed after retries: {last_err}")
+
+    # Fallback mock generator (keeps local dev working if GPU_SERVER_URL isn't set).
+    # References are only decoded here; the GPU path sends the stored bytes as-is.
+    # After a GPU fallback progress is already at 35; never report it going backwards.
+    if gpu_err is None:
+        _report(self, job_id, 5, "loading references")
+    refs = [_load_ref(p, size=512) for p in reference_images_paths]
 
-    # Fallback mock generator (keeps local dev working if GPU_SERVER_URL isn't set)
-    self.update_state(state="PROGRESS", meta={"progress": 35, "message": "assembling preview (mock)"})
+    _report(self, job_id, 35, "assembling preview (mock)")
     grid = _make_grid(refs, tile=512, cols=3)
 
-    self.update_state(state="PROGRESS", meta={"progress": 70, "message": "rendering output (mock)"})
+    _report(self, job_id, 70, "rendering output (mock)")
     headline = "Mock output" if not gpu_err else f"Mock output (GPU server unavailable: {gpu_err})"
     out = _draw_overlay(grid, prompt, headline=headline)
 
-    out_id = uuid.uuid4().hex
-    out_path = _outputs_dir() / f"gen-{out_id}.jpg"
-    out.save(out_path, format="JPEG", quality=92, optimize=True)
+    with _output_file("jpg") as (f, rel_url):
+        # Preview-grade output: single-pass encode, no Huffman optimization pass.
+        out.save(f, format="JPEG", quality=85)
 
-    self.update_state(state="PROGRESS", meta={"progress": 100, "message": "done"})
+    _report(self, job_id, 100, "done")
 
-    # Backend serves /storage/**
-    rel_url = f"/storage/outputs/{out_path.name}"
     logger.info("rid=%s job=%s complete (mock output=%s)", request_id, job_id, rel_url)
-    return {"job_id": job_id, "output_url": rel_url, "reference_count": len(reference_images_paths)}
+    # Flagged so the API never serves this placeholder to a later identical request (see `_dedup_key`).
+    return {"job_id": job_id, "output_url": rel_url, "reference_count": len(reference_images_paths), "mock": True}